@@ -1,46 +1,117 @@
 """The bus module."""
 
 
-import random
+import collections
 
 
 class Bus:
-  """Represents the system bus, attached to the caches."""
+  """Represents the system bus, attached to the caches.
+
+  The bus keeps a directory recording, for each memory line, which caches may
+  hold a copy of it. Misses are then only broadcast to those caches, rather
+  than to every cache on the bus."""
 
   def __init__(self):
     self.caches = []
 
+    # Map from cache_id to the bit representing that cache in the directory,
+    # and back from that bit to the cache itself.
+    self._cache_bits = {}
+    self._caches_by_bit = {}
+
+    # The directory. Maps a memory line to a bitmask of the caches which hold a
+    # valid copy of it. Caches report the lines they evict (see
+    # record_invalidate), and an entry is removed once no cache holds its line,
+    # so the directory never has more entries than there are cache slots.
+    self._sharers = collections.defaultdict(int)
+
+    # The number of address bits used for the offset within a line, shared by
+    # every cache on the bus. Addresses are mapped to memory lines by shifting
+    # these away.
+    self._offset_bits = None
+
   def add_cache(self, cache):
     """Add a cache to the bus."""
 
+    # The directory is keyed by memory line, so every cache must agree on what
+    # a line is.
+    if self._offset_bits is None:
+      self._offset_bits = cache.offset_bits
+    elif cache.offset_bits != self._offset_bits:
+      raise ValueError("All caches on the bus must have the same line size!")
+
+    bit = 1 << len(self.caches)
+    self._cache_bits[cache.cache_id] = bit
+    self._caches_by_bit[bit] = cache
+
     self.caches.append(cache)
 
   def add_caches(self, new_caches):
     """Add a list of caches to the bus."""
 
     for cache in new_caches:
-      self.caches.append(cache)
+      self.add_cache(cache)
+
+  def clear(self):
+    """Forgets which caches hold which memory lines.
+
+    Used when the caches on the bus have all been emptied."""
+
+    self._sharers.clear()
+
+  def record_invalidate(self, cache_id, address):
+    """Records that a cache no longer holds the memory line of an address, e.g.
+    because it has been evicted.
+
+    The line's directory entry is removed once no cache holds it."""
+
+    line = address >> self._offset_bits
+    sharers = self._sharers.get(line, 0) & ~self._cache_bits[cache_id]
+    if sharers:
+      self._sharers[line] = sharers
+    else:
+      self._sharers.pop(line, None)
 
   def read_miss(self, cache_id, address):
     """Instruct the bus to notify the caches of a read miss to an address.
 
     The cache_id argument identifies the cache which issued the read miss;
-    all caches which do not have that id are informed of the miss.
+    all other caches which may hold the address are informed of the miss.
 
-    Caches are notified in a random order."""
+    Caches are notified in the order they were added to the bus."""
 
-    for cache in self.caches:
-      if cache.cache_id != cache_id:
-        cache.notify_read_miss(address)
+    line = address >> self._offset_bits
+    bit = self._cache_bits[cache_id]
+    sharers = self._sharers[line]
+
+    # Notify every other sharer, lowest bit first.
+    mask = sharers & ~bit
+    while mask:
+      lowest = mask & -mask
+      mask ^= lowest
+      self._caches_by_bit[lowest].notify_read_miss(address)
+
+    # The reading cache now holds the line too.
+    self._sharers[line] = sharers | bit
 
   def write_miss(self, cache_id, address):
     """Instruct the bus to notify the caches of a write miss to an address.
 
     The cache_id argument identifies the cache which issued the write miss;
-    all caches which do not have that id are informed of the miss.
+    all other caches which may hold the address are informed of the miss.
+
+    Caches are notified in the order they were added to the bus."""
+
+    line = address >> self._offset_bits
+    bit = self._cache_bits[cache_id]
 
-    Caches are notified in a random order."""
+    # Notify every other sharer, lowest bit first.
+    mask = self._sharers[line] & ~bit
+    while mask:
+      lowest = mask & -mask
+      mask ^= lowest
+      self._caches_by_bit[lowest].notify_write_miss(address)
 
-    for cache in self.caches:
-      if cache.cache_id != cache_id:
-        cache.notify_write_miss(address)
\ No newline at end of file
+    # Every other copy has been invalidated, so the writing cache is now the
+    # only holder of the line.
+    self._sharers[line] = bit
@@ -1,65 +1,94 @@
 """Contains classes and functions that simulate a basic processor cache."""
 
 
-import collections
+# The possible states for a cache slot (line). These are plain module-level
+# integers so that the state machine in Cache can compare against them without
+# an attribute lookup on SlotState.
+INVALID, SHARED, MODIFIED = range(3)
+
+# Human-readable names for the slot states, indexed by state.
+_STATE_NAMES = ("INVALID", "SHARED", "MODIFIED")
 
 
 class SlotState(object):
-  """An enumeration representing the possible states for a cache slot (line)."""
+  """An enumeration representing the possible states for a cache slot (line).
+
+  The values are the module-level INVALID, SHARED and MODIFIED constants; this
+  class is kept so that existing users of SlotState continue to work."""
 
-  INVALID, SHARED, MODIFIED = range(3)
+  INVALID, SHARED, MODIFIED = INVALID, SHARED, MODIFIED
 
-  @classmethod
-  def pretty_string(cls, state):
+  @staticmethod
+  def pretty_string(state):
     """Return a human-readable version of an enum value."""
 
-    if state == SlotState.INVALID:
-      return "INVALID"
-    elif state == SlotState.SHARED:
-      return "SHARED"
-    elif state == SlotState.MODIFIED:
-      return "MODIFIED"
-    elif state == None:
+    if state is None:
       return "None"
-    else:
+    if not 0 <= state < len(_STATE_NAMES):
       raise ValueError("Unknown state %s!" % state)
-
+    return _STATE_NAMES[state]
 
 
 class CacheSlot(object):
-  """Represents a slot (line) in the cache.
+  """A view onto a slot (line) in the cache.
+
+  The cache stores its slots as parallel lists (one per field); a CacheSlot
+  reads and writes through to those lists for a single slot id. As with the
+  cache, no data is stored, only a tag and line state."""
+
+  __slots__ = ('_cache', '_slot_id')
 
-  Does not store any data, only a tag and line state."""
+  def __init__(self, cache, slot_id):
+    self._cache = cache
+    self._slot_id = slot_id
 
-  def __init__(self):
-    self.tag = None
-    self._state = SlotState.INVALID
-    self._prev_state = None
-    self.written_to = False
+  @property
+  def tag(self):
+    return self._cache.tags[self._slot_id]
+
+  @tag.setter
+  def tag(self, new_tag):
+    self._cache.tags[self._slot_id] = new_tag
 
   @property
   def state(self):
-    return self._state
+    return self._cache.states[self._slot_id]
 
   @state.setter
   def state(self, new_state):
-    """Update the state of the cache slot."""
+    """Update the state of the cache slot, remembering the previous state."""
+
+    self.set_state(new_state)
 
-    self._prev_state = self._state
-    self._state = new_state
+  def set_state(self, new_state):
+    """Update the state of the cache slot, remembering the previous state."""
+
+    states = self._cache.states
+    self._cache.previous_states[self._slot_id] = states[self._slot_id]
+    states[self._slot_id] = new_state
 
   @property
   def previous_state(self):
-    """The previous state of the cache slot."""
+    return self._cache.previous_states[self._slot_id]
+
+  @previous_state.setter
+  def previous_state(self, previous_state):
+    self._cache.previous_states[self._slot_id] = previous_state
 
-    return self._prev_state
+  @property
+  def written_to(self):
+    return self._cache.written_to[self._slot_id]
+
+  @written_to.setter
+  def written_to(self, written_to):
+    self._cache.written_to[self._slot_id] = written_to
 
   def __repr__(self):
     """The string representation of a cache slot."""
 
     return ("CacheSlot[state=%s, previous_state=%s, tag=%s, written_to=%s" %
-        (SlotState.pretty_string(self._state),
-        SlotState.pretty_string(self._prev_state),
+        (SlotState.pretty_string(self.state),
+        SlotState.pretty_string(self.previous_state),
         self.tag,
         self.written_to))
 
@@ -83,17 +112,45 @@ class Cache(object):
     self.slot_bits = _integer_log_base_two(number_lines)
     self.offset_bits = _integer_log_base_two(line_size)
 
+    # Precompute how an address is split up. The offset is contained in the
+    # lowest 'offset_bits' bits, the slot id in the next 'slot_bits' bits, and
+    # the tag in the remaining bits above them.
+    self._offset_bits = self.offset_bits
+    self._slot_mask = (1 << self.slot_bits) - 1
+    self._slot_shift = self.slot_bits + self.offset_bits
+
     self.bus = bus
     self.bus.add_cache(self)
 
     self.tracker = tracker
     self.tracker.add_cache(self)
 
-    # The cache contents are represented as a dictionary from slot id to
-    # CacheSlots, which are dynamically created.
-    self.cache_lines = collections.defaultdict(CacheSlot)
+    # Bind the bus and tracker methods used on every access once, rather than
+    # looking them up each time. This means the bus and tracker methods must
+    # not be replaced after the cache has been created.
+    self._bus_read_miss = bus.read_miss
+    self._bus_write_miss = bus.write_miss
+    self._bus_record_invalidate = bus.record_invalidate
+    self._tracker_read_miss = tracker.read_miss
+    self._tracker_read_hit = tracker.read_hit
+    self._tracker_write_miss = tracker.write_miss
+    self._tracker_write_hit = tracker.write_hit
+
+    # The cache contents are represented as parallel lists indexed by slot id,
+    # one per field of a slot. All slots start out INVALID with no tag.
+    self.states = [INVALID] * number_lines
+    self.previous_states = [None] * number_lines
+    self.tags = [None] * number_lines
+    self.written_to = [False] * number_lines
+
+    # Views of each slot, created once up front rather than every time a slot
+    # is asked for.
+    self.cache_lines = [CacheSlot(self, slot_id)
+        for slot_id in range(number_lines)]
 
     self.debug_mode = debug_mode
+    # Indentation used to line up debug output with the "Cache <id>: " header.
+    self._debug_prefix = " " * len("Cache %s: " % cache_id)
 
   def write(self, address):
     """Handles a write to a memory address.
@@ -103,123 +160,71 @@ class Cache(object):
 
     Returns true if the write caused a cache hit, false otherwise."""
 
-    tag, slot_id, _ = self._split_address(address)
-    cache_slot = self.cache_lines[slot_id]
-
-    if self.debug_mode:
-      print ("Cache %s: Write to %s [tag=%s, slot_id=%s]" % (self.cache_id,
-          address, tag, slot_id))
-
-    # There are 4 important possibilities: the slot is INVALID (miss), another
-    # memory line is in the slot (miss), the slot is SHARED (miss), or the
-    # slot is MODIFIED (hit).
-    if cache_slot.state == SlotState.INVALID:
-      if self.debug_mode:
-        prefix = " " * len("Cache %s: " % self.cache_id)
-        print prefix + "Write miss (Slot is INVALID)."
-
-      # If the slot is INVALID but the tag matches, some other processor caused
-      # us to make this miss.
-      coherence_miss = (tag == cache_slot.tag)
-      if self.debug_mode and coherence_miss:
-        print "Cache %s: Coherence miss." % self.cache_id
-
-      # Inform the statistics tracker. This must be done BEFORE informing other
-      # processors.
-      self.tracker.write_miss(self.cache_id, address, tag, slot_id,
-          coherence_miss)
-
-      # Notify the bus.
-      self.bus.write_miss(self.cache_id, address)
-
-      # In a real cache, the memory line would be loaded from main memory or
-      # other processors here.
-      
-      # Update the cache slot.
-      cache_slot.state = SlotState.MODIFIED
-      cache_slot.tag = tag
-      # We're replacing another slot, but writing to it, so written_to should be True.
-      cache_slot.written_to = True
-
-      # We missed.
-      return False
-
-    elif cache_slot.tag != tag:
-      if self.debug_mode:
-        prefix = " " * len("Cache %s: " % self.cache_id)
-        print prefix + "Write miss (Tag mismatch)."
-
-      # Inform the statistics tracker. This must be done BEFORE informing other
-      # processors.
-      self.tracker.write_miss(self.cache_id, address, tag, slot_id, False)
-
-      # Notify the bus.
-      self.bus.write_miss(self.cache_id, address)
-
-      # In a real cache, the memory line would be loaded from main memory or
-      # other processors here.
-
-      # Update the cache slot.
-      cache_slot.state = SlotState.MODIFIED
-      cache_slot.tag = tag
-      # We're replacing another slot, but writing to it, so written_to should be True.
-      cache_slot.written_to = True
-
-      # We missed.
-      return False
-
-    elif cache_slot.state == SlotState.SHARED:
-      if self.debug_mode:
-        prefix = " " * len("Cache %s: " % self.cache_id)
-        print prefix + "Write to SHARED."
-
-      # If the previous state was MODIFIED and the tag matches, some other
-      # processor caused us to make this miss.
-      coherence_miss = (cache_slot.previous_state == SlotState.MODIFIED and
-          tag == cache_slot.tag)
-      if self.debug_mode and coherence_miss:
-        print "Cache %s: Coherence miss." % self.cache_id
-
-      # Inform the statistics tracker. This must be done BEFORE informing other
-      # processors.
-      self.tracker.write_miss(self.cache_id, address, tag, slot_id,
-          coherence_miss)
-
-      # A write to shared state still counts as a miss, so other processors
-      # must be told.
-      self.bus.write_miss(self.cache_id, address)
-
-      # In a real cache, the memory line would *NOT* be loaded here, as there
-      # is no need.
+    if address < 0:
+      raise ValueError("address must be non-negative!")
 
-      # Update the cache slot.
-      cache_slot.state = SlotState.MODIFIED
-      cache_slot.tag = tag
-      # The slot is now written to.
-      cache_slot.written_to = True
+    slot_id = (address >> self._offset_bits) & self._slot_mask
+    tag = address >> self._slot_shift
+    state = self.states[slot_id]
+    tag_match = (self.tags[slot_id] == tag)
 
-      # We missed.
-      return False
+    # Look up what happens to the slot. See _WRITE_TRANSITIONS.
+    new_state, hit, description = _WRITE_TRANSITIONS[state][tag_match]
 
-    elif cache_slot.state == SlotState.MODIFIED:
-      if self.debug_mode:
-        prefix = " " * len("Cache %s: " % self.cache_id)
-        print prefix + "Local write hit."
+    if self.debug_mode:
+      print("Cache %s: Write to %s [tag=%s, slot_id=%s]" % (self.cache_id,
+          address, tag, slot_id))
+      print(self._debug_prefix + description)
 
+    if hit:
       # Inform the statistics tracker.
-      self.tracker.write_hit(self.cache_id, address, tag, slot_id)
+      self._tracker_write_hit(self.cache_id, address, tag, slot_id)
 
       # There is no need to inform the bus as the line is in MODIFIED.
 
-      # Update the cache slot anyway, so that the previous state is set
-      # correctly. The only way to get to MODIFIED is to write, so no
-      # need to set written_to.
-      cache_slot.state = cache_slot.state
+      # Update the previous state anyway, so that it is set correctly. The only
+      # way to get to MODIFIED is to write, so no need to set written_to.
+      self.previous_states[slot_id] = state
 
       # We hit!
       return True
-    else:
-      raise ValueError("cache_slot not in appropriate state!")
+
+    # If the tag matches, some other processor caused us to make this miss if
+    # either it invalidated our line, or it read our MODIFIED line and so
+    # forced it to SHARED.
+    coherence_miss = tag_match and (state == INVALID or
+        self.previous_states[slot_id] == MODIFIED)
+    if self.debug_mode and coherence_miss:
+      print("Cache %s: Coherence miss." % self.cache_id)
+
+    # Inform the statistics tracker. This must be done BEFORE informing other
+    # processors.
+    self._tracker_write_miss(self.cache_id, address, tag, slot_id,
+        coherence_miss)
+
+    # If a different line is being replaced, tell the bus it is no longer held
+    # here.
+    if state != INVALID and not tag_match:
+      self._evict(slot_id)
+
+    # Notify the bus. Even a write to a SHARED line counts as a miss, so other
+    # processors must be told.
+    self._bus_write_miss(self.cache_id, address)
+
+    # In a real cache, the memory line would be loaded from main memory or
+    # other processors here (unless the line was SHARED, in which case there is
+    # no need).
+
+    # Update the cache slot. Setting the tag is a no-op if it already matched.
+    self.previous_states[slot_id] = state
+    self.states[slot_id] = new_state
+    self.tags[slot_id] = tag
+    # Whether or not we're replacing another line, we're writing to the slot,
+    # so written_to should be True.
+    self.written_to[slot_id] = True
+
+    # We missed.
+    return False
 
   def read(self, address):
     """Handles a read to a memory address.
@@ -229,154 +234,188 @@ class Cache(object):
 
     Returns true if the read caused a cache hit, false otherwise."""
 
-    tag, slot_id, _ = self._split_address(address)
-    cache_slot = self.cache_lines[slot_id]
+    if address < 0:
+      raise ValueError("address must be non-negative!")
+
+    slot_id = (address >> self._offset_bits) & self._slot_mask
+    tag = address >> self._slot_shift
+    state = self.states[slot_id]
+    tag_match = (self.tags[slot_id] == tag)
+
+    # Look up what happens to the slot. See _READ_TRANSITIONS.
+    new_state, hit, description = _READ_TRANSITIONS[state][tag_match]
 
     if self.debug_mode:
       print("Cache %s: Read from %s [tag=%s, slot_id=%s]" % (self.cache_id,
           address, tag, slot_id))
+      print(self._debug_prefix + description)
 
-    # There are 3 important possibilities: the slot is INVALID (miss), another
-    # memory line is in the slot (miss), or the slot is either SHARED or
-    # MODIFIED (hit).
-    if cache_slot.state == SlotState.INVALID:
-      if self.debug_mode:
-        prefix = " " * len("Cache %s: " % self.cache_id)
-        print prefix + "Read miss (Slot is INVALID)."
-
-      # If the slot is INVALID but the tag matches, some other processor caused
-      # us to make this miss.
-      coherence_miss = (tag == cache_slot.tag)
-
-      # Inform the statistics tracker. This must be done BEFORE informing other
-      # processors.
-      self.tracker.read_miss(self.cache_id, address, tag, slot_id,
-          coherence_miss)
+    if hit:
+      # Inform the statistics tracker.
+      self._tracker_read_hit(self.cache_id, address, tag, slot_id)
 
-      # Notify the bus.
-      self.bus.read_miss(self.cache_id, address)
+      # There is no need to inform the bus as the line is in SHARED/MODIFIED.
 
-      # In a real cache, the memory line would be loaded from main memory or
-      # other processors here.
+      # Update the previous state anyway, so that it is set correctly.
+      self.previous_states[slot_id] = state
 
-      # Update the cache slot.
-      cache_slot.state = SlotState.SHARED
-      cache_slot.tag = tag
-      # As we're replacing another slot, reset written_to.
-      cache_slot.written_to = False
+      # We hit.
+      return True
 
-      # We missed.
-      return False
+    # If the slot is INVALID but the tag matches, some other processor caused
+    # us to make this miss.
+    coherence_miss = tag_match and state == INVALID
 
-    elif cache_slot.tag != tag:
-      if self.debug_mode:
-        prefix = " " * len("Cache %s: " % self.cache_id)
-        print prefix + "Read miss (Tag mismatch)."
+    # Inform the statistics tracker. This must be done BEFORE informing other
+    # processors.
+    self._tracker_read_miss(self.cache_id, address, tag, slot_id,
+        coherence_miss)
 
-      # Inform the statistics tracker.
-      self.tracker.read_miss(self.cache_id, address, tag, slot_id, False)
+    # If a different line is being replaced, tell the bus it is no longer held
+    # here.
+    if state != INVALID and not tag_match:
+      self._evict(slot_id)
 
-      # Notify the bus.
-      self.bus.read_miss(self.cache_id, address)
+    # Notify the bus.
+    self._bus_read_miss(self.cache_id, address)
 
-      # In a real cache, the memory line would be loaded from main memory or
-      # other processors here.
+    # In a real cache, the memory line would be loaded from main memory or
+    # other processors here.
 
-      old_state = cache_slot.state
-      # Update the cache slot.
-      cache_slot.state = SlotState.SHARED
-      cache_slot.tag = tag
-      # As we're replacing another slot, reset written_to.
-      cache_slot.written_to = False
+    # Update the cache slot.
+    self.previous_states[slot_id] = state
+    self.states[slot_id] = new_state
+    self.tags[slot_id] = tag
+    # The line has been (re)loaded, so reset written_to.
+    self.written_to[slot_id] = False
 
-      # We missed.
-      return False
+    # We missed.
+    return False
 
-    elif (cache_slot.state == SlotState.SHARED or
-        cache_slot.state == SlotState.MODIFIED):
-      if self.debug_mode:
-        prefix = " " * len("Cache %s: " % self.cache_id)
-        print prefix + "Local read (SHARED or MODIFIED)."
+  def get_cache_line(self, slot_id):
+    """Return a view of a line in the cache."""
 
-      # Inform the statistics tracker.
-      self.tracker.read_hit(self.cache_id, address, tag, slot_id)
+    return self.cache_lines[slot_id]
 
-      # There is no need to inform the bus as the line is in SHARED/MODIFIED.
+  def clear(self):
+    """Empties the cache, returning every slot to the state it was created in.
 
-      # Update the cache slot anyway, so that the previous state is set
-      # correctly.
-      cache_slot.state = cache_slot.state
+    The cache stays attached to its bus and tracker."""
 
-      # We hit.
-      return True
+    for (slot_id, state) in enumerate(self.states):
+      if state != INVALID:
+        self._evict(slot_id)
 
-    else:
-      raise ValueError("cache_slot not in appropriate state!")
+    number_lines = len(self.states)
+    self.states[:] = [INVALID] * number_lines
+    self.previous_states[:] = [None] * number_lines
+    self.tags[:] = [None] * number_lines
+    self.written_to[:] = [False] * number_lines
 
-  def get_cache_line(self, slot_id):
-    """Return a line in the cache."""
+  def _evict(self, slot_id):
+    """Tells the bus that the valid line in a slot is no longer held."""
 
-    return self.cache_lines[slot_id]
+    self._bus_record_invalidate(self.cache_id,
+        (self.tags[slot_id] << self._slot_shift) |
+        (slot_id << self._offset_bits))
 
   def notify_read_miss(self, address):
     """Handles an external read-miss to an address.
 
     If the given address is cached locally, its state will be set to SHARED."""
 
-    tag, slot_id, _ = self._split_address(address)
-    cache_slot = self.cache_lines[slot_id]
+    if address < 0:
+      raise ValueError("address must be non-negative!")
+
+    slot_id = (address >> self._offset_bits) & self._slot_mask
+    tag = address >> self._slot_shift
+    state = self.states[slot_id]
 
-    if cache_slot.state == SlotState.MODIFIED and cache_slot.tag == tag:
+    # Look up what happens to the slot. See _REMOTE_READ_TRANSITIONS.
+    new_state, description = _REMOTE_READ_TRANSITIONS[state]
+
+    if description is not None and self.tags[slot_id] == tag:
       if self.debug_mode:
-        print("Cache %s: Changing %s [tag=%s, slot_id=%s] from"
-            " MODIFIED to SHARED." % (self.cache_id, address, tag, slot_id))
+        print("Cache %s: Changing %s [tag=%s, slot_id=%s] from %s" %
+            (self.cache_id, address, tag, slot_id, description))
 
       # In a real processor, the memory line would be returned to the other
       # cache or written to main memory.
 
       # Update the cache slot.
-      cache_slot.state = SlotState.SHARED
+      self.previous_states[slot_id] = state
+      self.states[slot_id] = new_state
 
   def notify_write_miss(self, address):
     """Handles an external write-miss to an address.
 
     If the given address is cached locally, its state will be set to INVALID."""
 
-    tag, slot_id, _ = self._split_address(address)
-    cache_slot = self.cache_lines[slot_id]
+    if address < 0:
+      raise ValueError("address must be non-negative!")
+
+    slot_id = (address >> self._offset_bits) & self._slot_mask
+    tag = address >> self._slot_shift
+    state = self.states[slot_id]
+
+    # Look up what happens to the slot. See _REMOTE_WRITE_TRANSITIONS.
+    new_state, description = _REMOTE_WRITE_TRANSITIONS[state]
 
-    if cache_slot.state != SlotState.INVALID and cache_slot.tag == tag:
+    if description is not None and self.tags[slot_id] == tag:
       if self.debug_mode:
-        print ("Cache %s: Changing %s [tag=%s, slot_id=%s] from"
-            " MODIFIED/SHARED to INVALID." %
-            (self.cache_id, address, tag, slot_id))
+        print("Cache %s: Changing %s [tag=%s, slot_id=%s] from %s" %
+            (self.cache_id, address, tag, slot_id, description))
 
       # In a real processor, if we were in MODIFIED state, the memory line
       # would be returned to the other cache or written to main memory.
 
       # Update the cache slot.
-      cache_slot.state = SlotState.INVALID
+      self.previous_states[slot_id] = state
+      self.states[slot_id] = new_state
       # No need to update the tag or written_to status: INVALID overrides those.
 
-  def _split_address(self, address):
-    """Splits an address into the tag, slot, and offset."""
-
-    if address < 0:
-      raise ValueError("address must be non-negative!")
-
-    # The offset is contained in the lowest 'self.offset_bits' bits.
-    offset_mask = (1 << self.offset_bits) - 1
-    offset = address & offset_mask
-
-    # The slot id is contained in the middle 'self.slot_bits' bits.
-    offset_and_slot_mask = (1 << (self.slot_bits + self.offset_bits)) - 1 
-    slot = (address & offset_and_slot_mask) >> self.offset_bits
 
-    # The tag is contained in the remaining bits above the offset and slot id.
-    tag_mask = ~offset_and_slot_mask
-    tag = (address & tag_mask) >> (self.slot_bits + self.offset_bits)
-
-    return tag, slot, offset
+# The MSI state transitions for local accesses, indexed first by the current
+# state of the slot and then by whether the slot's tag matches the address.
+# Each entry is (new state, whether the access hits, debug description).
+_WRITE_TRANSITIONS = (
+  # INVALID
+  ((MODIFIED, False, "Write miss (Slot is INVALID)."),
+   (MODIFIED, False, "Write miss (Slot is INVALID).")),
+  # SHARED
+  ((MODIFIED, False, "Write miss (Tag mismatch)."),
+   (MODIFIED, False, "Write to SHARED.")),
+  # MODIFIED
+  ((MODIFIED, False, "Write miss (Tag mismatch)."),
+   (MODIFIED, True, "Local write hit.")),
+)
+
+_READ_TRANSITIONS = (
+  # INVALID
+  ((SHARED, False, "Read miss (Slot is INVALID)."),
+   (SHARED, False, "Read miss (Slot is INVALID).")),
+  # SHARED
+  ((SHARED, False, "Read miss (Tag mismatch)."),
+   (SHARED, True, "Local read (SHARED or MODIFIED).")),
+  # MODIFIED
+  ((SHARED, False, "Read miss (Tag mismatch)."),
+   (MODIFIED, True, "Local read (SHARED or MODIFIED).")),
+)
+
+# The MSI state transitions for remote misses to a slot whose tag matches the
+# address, indexed by the current state of the slot. Each entry is (new state,
+# debug description), where a description of None means the slot is unchanged.
+_REMOTE_READ_TRANSITIONS = (
+  (INVALID, None),
+  (SHARED, None),
+  (SHARED, "MODIFIED to SHARED."),
+)
+
+_REMOTE_WRITE_TRANSITIONS = (
+  (INVALID, None),
+  (INVALID, "MODIFIED/SHARED to INVALID."),
+  (INVALID, "MODIFIED/SHARED to INVALID."),
+)
 
 
 def _is_power_of_two(num):
@@ -393,8 +432,5 @@ def _integer_log_base_two(num):
   if not _is_power_of_two(num):
     raise ValueError("Argument is not a power of 2!")
 
-  answer = 0
-  while 2**answer <= num:
-    answer += 1
-
-  return answer - 1
\ No newline at end of file
+  # For a power of 2, the log is the position of its single set bit.
+  return num.bit_length() - 1
\ No newline at end of file
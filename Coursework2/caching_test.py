@@ -2,12 +2,15 @@
 
 import unittest
 
+from buses import Bus
 from caching import Cache, SlotState
 
 
-class FakeBus():
+class FakeBus(object):
   """A fake implementation of the bus to be injected."""
 
+  __slots__ = ()
+
   def add_cache(self, cache):
     pass
 
@@ -17,10 +20,15 @@ class FakeBus():
   def write_miss(self, cache_id, address):
     pass
 
+  def record_invalidate(self, cache_id, address):
+    pass
+
 
-class FakeTracker():
+class FakeTracker(object):
   """A fake implementation of the tracker to be injected."""
 
+  __slots__ = ()
+
   def add_cache(self, cache):
     pass
 
@@ -37,6 +45,11 @@ class FakeTracker():
     pass
 
 
+# The fakes hold no state, so a single instance of each is shared by all tests.
+_FAKE_BUS = FakeBus()
+_FAKE_TRACKER = FakeTracker()
+
+
 class CachingTest(unittest.TestCase):
   """Tests for the caching module."""
 
@@ -45,8 +58,8 @@ class CachingTest(unittest.TestCase):
   _SIZE_OF_CACHE_LINE = 4
 
   def setUp(self):
-    self.fake_bus = FakeBus()
-    self.fake_tracker = FakeTracker()
+    self.fake_bus = _FAKE_BUS
+    self.fake_tracker = _FAKE_TRACKER
 
     self.default_cache = Cache(
         0, # Cache id.
@@ -358,6 +371,91 @@ class CachingTest(unittest.TestCase):
     line = self.default_cache.get_cache_line(15) # Address 60 ==> slot 15
     self.assertTrue(line.written_to)
 
+  def test_clear(self):
+    """Tests that clearing a cache returns every slot to its initial state."""
+
+    self.default_cache.read(10)
+    self.default_cache.write(20)
+    self.default_cache.write(20)
+
+    self.default_cache.clear()
+
+    for slot_id in (2, 5):
+      line = self.default_cache.get_cache_line(slot_id)
+      self.assertEqual(line.state, SlotState.INVALID)
+      self.assertEqual(line.previous_state, None)
+      self.assertEqual(line.tag, None)
+      self.assertFalse(line.written_to)
+
+    # The cache works as normal afterwards.
+    self.assertFalse(self.default_cache.read(10))
+    self.assertTrue(self.default_cache.read(10))
+
+  def test_negative_address(self):
+    """Tests that negative addresses are rejected, even outside debug mode."""
+
+    for access in (self.default_cache.read, self.default_cache.write,
+        self.default_cache.notify_read_miss,
+        self.default_cache.notify_write_miss):
+      with self.assertRaises(ValueError):
+        access(-1)
+
+  def test_bus_directory(self):
+    """Tests that the bus tracks exactly which caches hold each memory line."""
+
+    # Two caches with 4 lines, 4 words/line, so addresses 0 and 16 share slot 0.
+    bus = Bus()
+    caches = [Cache(cache_id, 4, 4, bus, self.fake_tracker, debug_mode=False)
+        for cache_id in range(2)]
+
+    caches[0].read(0)
+    caches[1].read(0)
+    self.assertEqual(dict(bus._sharers), {0: 0b11})
+
+    # P0 evicts line 0 to read line 4.
+    caches[0].read(16)
+    self.assertEqual(dict(bus._sharers), {0: 0b10, 4: 0b01})
+
+    # P1 evicts line 0 to write line 4, invalidating P0's copy.
+    caches[1].write(16)
+    self.assertEqual(caches[0].get_cache_line(0).state, SlotState.INVALID)
+    self.assertEqual(dict(bus._sharers), {4: 0b10})
+
+    # Clearing a cache removes its lines from the directory.
+    caches[1].clear()
+    self.assertEqual(dict(bus._sharers), {})
+
+  def test_bus_line_size_mismatch(self):
+    """Tests that caches with different line sizes cannot share a bus."""
+
+    bus = Bus()
+    Cache(0, 16, 4, bus, self.fake_tracker, debug_mode=False)
+    with self.assertRaises(ValueError):
+      Cache(1, 16, 8, bus, self.fake_tracker, debug_mode=False)
+
+  def test_cache_slot_setters(self):
+    """Tests that a CacheSlot writes through to its cache."""
+
+    line = self.default_cache.get_cache_line(3)
+    line.tag = 7
+    line.state = SlotState.SHARED
+    line.written_to = True
+
+    self.assertEqual(self.default_cache.tags[3], 7)
+    self.assertEqual(self.default_cache.states[3], SlotState.SHARED)
+    self.assertTrue(self.default_cache.written_to[3])
+
+    # Setting the state, through the property or set_state, remembers the state
+    # it replaces.
+    self.assertEqual(self.default_cache.previous_states[3], SlotState.INVALID)
+    line.set_state(SlotState.MODIFIED)
+    self.assertEqual(self.default_cache.states[3], SlotState.MODIFIED)
+    self.assertEqual(self.default_cache.previous_states[3], SlotState.SHARED)
+
+    # The cache sees the line as MODIFIED, so a write to it (tag 7, slot 3)
+    # hits.
+    self.assertTrue(self.default_cache.write(((7 << 7) | 3) << 2))
+
 
 if __name__ == "__main__":
   unittest.main()
\ No newline at end of file
@@ -0,0 +1,61 @@
+"""Shared code for drawing the per-cache bar graphs."""
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+
+# The number of caches (and so lines in a data file, and bars per group).
+NUMBER_CACHES = 4
+
+
+def load(filename, number_stats):
+  """Loads a per-cache data file.
+
+  The file must contain one line per cache, each holding number_stats
+  values. Returns the data as a NUMBER_CACHES x number_stats array."""
+
+  data = np.loadtxt(filename, ndmin=2)
+  if data.shape[0] != NUMBER_CACHES:
+    raise ValueError("Expected %s lines, found %s." %
+        (NUMBER_CACHES, data.shape[0]))
+  if data.shape[1] != number_stats:
+    raise ValueError("Expected %s values per line, found %s." %
+        (number_stats, data.shape[1]))
+
+  return data
+
+
+def render(data, title, xlabels):
+  """Draws a bar graph with one group of bars per statistic.
+
+  Each row of data holds the statistics for a single cache, and is drawn as
+  one bar in each group."""
+
+  number_stats = data.shape[1]
+  indices = np.arange(number_stats)
+  width = 0.2
+
+  fig = plt.figure()
+  ax = fig.add_subplot(111)
+
+  colors = ['#EF2929', '#729FCF', '#F57900', '#73D216']
+
+  names = []
+  rects = []
+  for (i, values) in enumerate(data):
+    left = indices + (i * width)
+    color = colors[i % len(colors)]
+    rects.append(ax.bar(left, values, width, color=color))
+
+    names.append("Cache %s" % i)
+
+  ax.set_title(title)
+  ax.set_ylabel('Percentage')
+  ax.set_xticks(indices + (2 * width))
+  ax.set_xticklabels(xlabels)
+
+  ax.axis([-0.1, number_stats, 0, 100])
+
+  ax.legend([rect[0] for rect in rects], names, loc='best')
+
+  plt.show()
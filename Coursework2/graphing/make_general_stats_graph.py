@@ -1,23 +1,21 @@
-import math
 import matplotlib.pyplot as plt
 import numpy as np
 import sys
 
 def main():
   if len(sys.argv) != 2:
-    print "Usage: %s data_file" % sys.argv[0]
+    print("Usage: %s data_file" % sys.argv[0])
     return
 
   # 6 stats in the line info graph. 
   N = 6
 
-  with open(sys.argv[1], "r") as f:
-    lines = [line.strip() for line in f]
-    if len(lines) != 1:
-      raise ValueError("Expected 1 line, found %s." % len(data))
-    values = map(float, lines[0].split())
-    if len(values) != N:
-      raise ValueError("Unexpected number of parts in line '%s'" % lines[0])
+  # The data file is a single line of N values.
+  values = np.loadtxt(sys.argv[1], ndmin=1)
+  if values.ndim != 1:
+    raise ValueError("Expected 1 line, found %s." % len(values))
+  if values.size != N:
+    raise ValueError("Expected %s values, found %s." % (N, values.size))
 
   indices = np.arange(N)
   width = 1
@@ -37,10 +35,6 @@ def main():
       'Addresses\naccessed by\n2 processors',
       'Addresses\naccessed by\n>2 processors'))
 
-  # Round up the Y value to next 10.
-  max_y = max(values)
-  y_limit = int(math.ceil(max_y / 10)) * 10
-
   ax.axis([-0.1, N, 0, 100])
 
   plt.show()
@@ -4,8 +4,10 @@
 import caching
 import buses
 import itertools
+import operator
 import optparse
 import statistics
+import sys
 
 
 class SimulationEnvironment:
@@ -15,17 +17,34 @@ class SimulationEnvironment:
 
   # The set of inconsistent cache line states for a given memory block across
   # two caches.
-  INCONSISTENT_STATES = [
-    (caching.SlotState.MODIFIED, caching.SlotState.MODIFIED),
-    (caching.SlotState.MODIFIED, caching.SlotState.SHARED),
-    (caching.SlotState.SHARED, caching.SlotState.MODIFIED)
-  ]
+  INCONSISTENT_STATES = frozenset([
+    (caching.MODIFIED, caching.MODIFIED),
+    (caching.MODIFIED, caching.SHARED),
+    (caching.SHARED, caching.MODIFIED)
+  ])
+
+  # INCONSISTENT_STATES as a bitmask, so that a pair of states can be tested
+  # without building a tuple. Bit ((state1 << 2) | state2) is set for each
+  # inconsistent pair.
+  _INCONSISTENT_MASK = sum(1 << ((state1 << 2) | state2)
+      for (state1, state2) in INCONSISTENT_STATES)
+
+  # The buffer size used when reading trace files. Traces can be millions of
+  # lines long, so read them in large blocks.
+  READ_BUFFER_SIZE = 1 << 22
 
   def __init__(self, number_processors, number_lines, line_size,
-      debug_mode=False):
-    """Initializes the simulation, setting up the bus and caches."""
+      debug_mode=False, debug_check_interval=1):
+    """Initializes the simulation, setting up the bus and caches.
+
+    In debug mode, the caches are checked for consistency every
+    debug_check_interval accesses, and at the end of the simulation."""
+
+    if debug_check_interval < 1:
+      raise ValueError("Debug check interval must be positive!")
 
     self.debug_mode = debug_mode
+    self.debug_check_interval = debug_check_interval
 
     self.tracker = statistics.SimulationStatisticsTracker()
 
@@ -33,7 +52,7 @@ class SimulationEnvironment:
 
     # Set up the caches. Each cache will register itself with the bus.
     self.caches = []
-    for cache_id in xrange(number_processors):
+    for cache_id in range(number_processors):
       cache = caching.Cache(cache_id, number_lines, line_size, shared_bus,
           self.tracker, self.debug_mode)
       self.caches.append(cache)
@@ -44,45 +63,80 @@ class SimulationEnvironment:
     The trace is retrieved from the file named in the trace_filename
     argument."""
 
-    with open(trace_filename, "r") as trace_file:
+    # Look up each cache's read and write methods once, rather than on every
+    # access.
+    readers = [cache.read for cache in self.caches]
+    writers = [cache.write for cache in self.caches]
+    debug_mode = self.debug_mode
+
+    # The number of accesses simulated, used to decide when to check for
+    # consistency in debug mode.
+    number_accesses = 0
+
+    buffer_size = SimulationEnvironment.READ_BUFFER_SIZE
+    with open(trace_filename, "r", buffer_size) as trace_file:
       for line in trace_file:
         # Get rid of any comments.
-        line = line.split("#")[0].strip()
-        if len(line) == 0:
-          # Comment line, skip.
-          continue
+        if "#" in line:
+          line = line.split("#")[0]
 
         parts = line.split()
+        if len(parts) == 0:
+          # Comment line, skip.
+          continue
 
         cache_id = int(parts[0][1:])
         access_type = parts[1]
         address = int(parts[2])
 
         if access_type == "R":
-          self.caches[cache_id].read(address)
+          readers[cache_id](address)
         elif access_type == "W":
-          self.caches[cache_id].write(address)
+          writers[cache_id](address)
         else:
-          print "ERROR: Unknown access type '%s'" % access_type
+          print("ERROR: Unknown access type '%s'" % access_type)
           return
 
         # Sanity check. Early exit means we dont call the expensive
-        # _test_consistency unless in debug mode.
-        if self.debug_mode and not self._test_consistency():
-          print "ERROR: Caches inconsistent."
-          return
+        # consistency test unless in debug mode.
+        if debug_mode:
+          if self.debug_check_interval == 1:
+            # An access can only change the slot it maps to (in any cache, as
+            # all caches share the same geometry), so only that slot needs to
+            # be checked.
+            cache = self.caches[cache_id]
+            slot_id = (address >> cache.offset_bits) & (
+                (1 << cache.slot_bits) - 1)
+            consistent = self._test_slot_consistency(slot_id)
+          else:
+            # Only check every debug_check_interval accesses, but then check
+            # every slot, as any of them may have changed since the last check.
+            number_accesses += 1
+            consistent = (number_accesses % self.debug_check_interval != 0 or
+                self._test_consistency())
+
+          if not consistent:
+            print("ERROR: Caches inconsistent.")
+            return
+
+    # Make sure the simulation ends up consistent, whatever the check interval.
+    if self.debug_mode and not self._test_consistency():
+      print("ERROR: Caches inconsistent.")
 
   def report_stats(self):
     """Prints out statistics on the simulation."""
 
+    # The report is built up as a list of lines and written out in one go.
+    out = []
+
     # The header.
-    print "-" * 21
-    print "Simulation Statistics"
-    print "-" * 21
-    print
+    out.append("-" * 21)
+    out.append("Simulation Statistics")
+    out.append("-" * 21)
+    out.append("")
 
-    print "Per Cache Statistics:"
-    print
+    out.append("Per Cache Statistics:")
+    out.append("")
 
     # Print the per-cache statistics (i.e. (a))
     for cache in self.caches:
@@ -107,28 +161,31 @@ class SimulationEnvironment:
       static_shared_read_write_line_accesses = (
           stats["static_shared_read_write_line_accesses"])
 
-      print "Cache %s" % cache.cache_id
-
-      print self._format_line("\tMiss rate", misses, accesses)
-      print self._format_line("\tRead miss rate", read_misses, reads)
-      print self._format_line("\tWrite miss rate", write_misses, writes)
-      print self._format_line("\tCoherence miss rate", coherence_misses,
-          misses)
-
-      print self._format_line("\tDynamic private line access rate",
-          dynamic_private_line_accesses, accesses)
-      print self._format_line("\tDynamic shared read-only line access rate",
-          dynamic_shared_read_only_line_accesses, accesses)
-      print self._format_line("\tDynamic shared read-write line access rate",
-          dynamic_shared_read_write_line_accesses, accesses)
-
-      print self._format_line("\tStatic private line access rate",
-          static_private_line_accesses, accesses)
-      print self._format_line("\tStatic shared read-only line access rate",
-          static_shared_read_only_line_accesses, accesses)
-      print self._format_line("\tStatic shared read-write line access rate",
-          static_shared_read_write_line_accesses, accesses)
-      print
+      out.append("Cache %s" % cache.cache_id)
+
+      out.append(self._format_line("\tMiss rate", misses, accesses))
+      out.append(self._format_line("\tRead miss rate", read_misses, reads))
+      out.append(self._format_line("\tWrite miss rate", write_misses, writes))
+      out.append(self._format_line("\tCoherence miss rate", coherence_misses,
+          misses))
+
+      out.append(self._format_line("\tDynamic private line access rate",
+          dynamic_private_line_accesses, accesses))
+      out.append(self._format_line(
+          "\tDynamic shared read-only line access rate",
+          dynamic_shared_read_only_line_accesses, accesses))
+      out.append(self._format_line(
+          "\tDynamic shared read-write line access rate",
+          dynamic_shared_read_write_line_accesses, accesses))
+
+      out.append(self._format_line("\tStatic private line access rate",
+          static_private_line_accesses, accesses))
+      out.append(self._format_line("\tStatic shared read-only line access rate",
+          static_shared_read_only_line_accesses, accesses))
+      out.append(self._format_line(
+          "\tStatic shared read-write line access rate",
+          static_shared_read_write_line_accesses, accesses))
+      out.append("")
 
     # Print the general statistics.
     stats = self.tracker.get_general_stats()
@@ -151,54 +208,46 @@ class SimulationEnvironment:
         stats["addressed_by_more_than_two_processors"])
     addresses = stats["addresses"]
 
-    print "General Statistics:"
-    print
-
-    print self._format_line("\tDynamic private line access rate",
-        dynamic_private_line_accesses, accesses)
-    print self._format_line("\tDynamic shared read-only line access rate",
-        dynamic_shared_read_only_line_accesses, accesses)
-    print self._format_line("\tDynamic shared read-write line access rate",
-        dynamic_shared_read_write_line_accesses, accesses)
-
-    print self._format_line("\tStatic private line access rate",
-        static_private_line_accesses, accesses)
-    print self._format_line("\tStatic shared read-only line access rate",
-        static_shared_read_only_line_accesses, accesses)
-    print self._format_line("\tStatic shared read-write line access rate",
-        static_shared_read_write_line_accesses, accesses)
-
-    print self._format_line("\tAddresses addressed by one processor",
-        addressed_by_one_processor, addresses)
-    print self._format_line("\tAddresses addressed by two processors",
-        addressed_by_two_processors, addresses)
-    print self._format_line("\tAddresses addressed by more than two processors",
-        addressed_by_more_than_two_processors, addresses)
+    out.append("General Statistics:")
+    out.append("")
+
+    out.append(self._format_line("\tDynamic private line access rate",
+        dynamic_private_line_accesses, accesses))
+    out.append(self._format_line("\tDynamic shared read-only line access rate",
+        dynamic_shared_read_only_line_accesses, accesses))
+    out.append(self._format_line("\tDynamic shared read-write line access rate",
+        dynamic_shared_read_write_line_accesses, accesses))
+
+    out.append(self._format_line("\tStatic private line access rate",
+        static_private_line_accesses, accesses))
+    out.append(self._format_line("\tStatic shared read-only line access rate",
+        static_shared_read_only_line_accesses, accesses))
+    out.append(self._format_line("\tStatic shared read-write line access rate",
+        static_shared_read_write_line_accesses, accesses))
+
+    out.append(self._format_line("\tAddresses addressed by one processor",
+        addressed_by_one_processor, addresses))
+    out.append(self._format_line("\tAddresses addressed by two processors",
+        addressed_by_two_processors, addresses))
+    out.append(self._format_line(
+        "\tAddresses addressed by more than two processors",
+        addressed_by_more_than_two_processors, addresses))
+
+    sys.stdout.write("\n".join(out) + "\n")
 
   def _format_line(self, prefix, numerator, denominator):
     """Formats a line for output."""
 
     # Determine the output ratio.
-    try:
+    if denominator:
       ratio = float(numerator) / denominator
-    except ZeroDivisionError:
+    else:
       ratio = float("nan")
 
-    # Get the ratio as a string.
-    ratio_string = "{0:.2%}".format(ratio)
-    percent_spaces = 7 - len(ratio_string)
-
-    # Work out how much the 'X of Y' needs padded to all be aligned. 47 is a
-    # magic number, equivalent to the longest output line.
-    spaces = (47 - len(prefix)) + percent_spaces
-    spacer = " " * spaces
-
-    # Determine how much to pad the numerator and denominator.
-    numerator_padding = " " * (6 - len(str(int(numerator))))
-    denominator_padding = " " * (6 - len(str(int(denominator))))
-
-    return "{0}: {1}{2}({3}{4:.0f} of {5}{6:.0f})".format(prefix, ratio_string,
-        spacer, numerator_padding, numerator, denominator_padding, denominator)
+    # Pad the ratio so that the '(X of Y)' parts are all aligned. 54 is a magic
+    # number, equivalent to the longest prefix (47) plus the longest ratio (7).
+    return "%s: %-*s(%6d of %6d)" % (prefix, 54 - len(prefix),
+        "%.2f%%" % (ratio * 100), numerator, denominator)
 
   def _test_consistency(self):
     """Tests that the simulation is consistent.
@@ -211,33 +260,63 @@ class SimulationEnvironment:
 
     This is VERY EXPENSIVE to compute!"""
 
+    # Index the memory blocks held by each cache, identifying a block by its
+    # (slot id, tag) pair. An INVALID copy can never be inconsistent, so only
+    # valid copies (those with a non-zero state) are indexed.
+    number_slots = len(self.caches[0].tags)
+    slot_ids = range(number_slots)
+    all_modified = [caching.MODIFIED] * number_slots
+    valid_blocks = []
+    modified_blocks = []
+    for cache in self.caches:
+      blocks = list(zip(slot_ids, cache.tags))
+      valid_blocks.append(set(itertools.compress(blocks, cache.states)))
+      modified_blocks.append(set(itertools.compress(blocks,
+          map(operator.eq, cache.states, all_modified))))
+
+    # Every inconsistent combination of states involves a MODIFIED copy, so two
+    # caches are inconsistent exactly when one holds a MODIFIED copy of a block
+    # that the other also holds.
+    consistent = True
+    for (i, j) in itertools.combinations(range(len(self.caches)), 2):
+      conflicts = ((modified_blocks[i] & valid_blocks[j]) |
+          (valid_blocks[i] & modified_blocks[j]))
+      for (slot_id, tag) in sorted(conflicts):
+        self._report_inconsistency(slot_id, tag, self.caches[i],
+            self.caches[j])
+        consistent = False
+
+    return consistent
+
+  def _test_slot_consistency(self, slot_id):
+    """Tests that a single slot is consistent across all of the caches.
+
+    Returns True if the slot is consistent, False otherwise."""
+
     consistent = True
     for (cache1, cache2) in itertools.combinations(self.caches, 2):
-      # Obtain the known slot ids. As the caches are backed by a dictionary,
-      # not all slots may exist yet (or ever.)
-      cache1_keyset = set(cache1.cache_lines)
-      cache2_keyset = set(cache2.cache_lines)
-
-      # Any slot that is in both dictionaries may contain the same memory block.
-      for common_slot_id in cache1_keyset.intersection(cache2_keyset):
-        cache1_slot = cache1.cache_lines[common_slot_id]
-        cache2_slot = cache2.cache_lines[common_slot_id]
-
-        if cache1_slot.tag != cache2_slot.tag:
-          # The slots hold different memory blocks, so fine.
-          continue
+      # Only slots holding the same memory block can conflict. Slots that have
+      # never been filled have no tag.
+      tag = cache1.tags[slot_id]
+      if tag is None or tag != cache2.tags[slot_id]:
+        continue
 
-        states = (cache1_slot.state, cache2_slot.state)
-        if states in SimulationEnvironment.INCONSISTENT_STATES:
-          print("Iconsistent states found for slot %s, tag %s."
-              "Cache %s: %s. Cache %s: %s." %
-              (common_slot_id, cache1_slot.tag,
-              cache1.cache_id, cache1_slot.state,
-              cache2.cache_id, cache2_slot.state))
-          consistent = False
+      state_pair = (cache1.states[slot_id] << 2) | cache2.states[slot_id]
+      if (SimulationEnvironment._INCONSISTENT_MASK >> state_pair) & 1:
+        self._report_inconsistency(slot_id, tag, cache1, cache2)
+        consistent = False
 
     return consistent
 
+  def _report_inconsistency(self, slot_id, tag, cache1, cache2):
+    """Prints out details of an inconsistent slot between two caches."""
+
+    print("Iconsistent states found for slot %s, tag %s."
+        "Cache %s: %s. Cache %s: %s." %
+        (slot_id, tag,
+        cache1.cache_id, cache1.states[slot_id],
+        cache2.cache_id, cache2.states[slot_id]))
+
 
 def main():
   """Sets up and executes a simulation of a given trace file."""
@@ -275,6 +354,15 @@ def main():
     default=False,
     dest="debug_mode",
     help="Turn debug mode on. [default: %default]")
+  parser.add_option(
+    "-c",
+    "--debug_check_interval",
+    action="store",
+    default=1,
+    dest="debug_check_interval",
+    help=("In debug mode, how many accesses to simulate between consistency "
+        "checks. [default: %default]"),
+    type="int")
 
   (options, args) = parser.parse_args()
 
@@ -285,10 +373,11 @@ def main():
 
   trace_filename = args[0]
   if options.debug_mode:
-    print "File: %s" % trace_filename
+    print("File: %s" % trace_filename)
 
   simulation = SimulationEnvironment(options.number_processors,
-      options.number_lines, options.line_size, debug_mode=options.debug_mode)
+      options.number_lines, options.line_size, debug_mode=options.debug_mode,
+      debug_check_interval=options.debug_check_interval)
   simulation.simulate(trace_filename)
   simulation.report_stats()
 
@@ -1,7 +1,7 @@
 """Tests for the coursework."""
 
 import contextlib
-from cStringIO import StringIO
+from io import StringIO
 import sys
 import unittest
 
@@ -12,7 +12,7 @@ from parse_trace import SimulationEnvironment
 """A context manager that allows us to capture print statements, i.e.
 
 >> with capture_output() as out:
->>   print "Hello, World!"
+>>   print("Hello, World!")
 >> out
 ['Hello, World!\n', '']
 """
@@ -24,7 +24,7 @@ def capture_output():
     sys.stdout, sys.stderr = out
     yield out
   finally:
-    sys.stdout, sys.stdout = old_out, old_err
+    sys.stdout, sys.stderr = old_out, old_err
     out[0] = out[0].getvalue()
     out[1] = out[1].getvalue()
 
@@ -50,6 +50,73 @@ class SimulationTest(unittest.TestCase):
         # SimulationEnvironment.simulate() execute.
         debug_mode=True)
 
+  def _count_consistency_tests(self, simulation):
+    """Wraps simulation._test_consistency so that its calls are counted.
+
+    Returns a list whose only element is the number of calls so far."""
+
+    calls = [0]
+    test_consistency = simulation._test_consistency
+    def counting_test_consistency():
+      calls[0] += 1
+      return test_consistency()
+    simulation._test_consistency = counting_test_consistency
+    return calls
+
+  def _make_simulation(self, debug_check_interval):
+    return SimulationEnvironment(
+        SimulationTest._NUMBER_OF_PROCESSORS,
+        SimulationTest._NUMBER_OF_CACHE_LINES,
+        SimulationTest._SIZE_OF_CACHE_LINE,
+        debug_mode=True,
+        debug_check_interval=debug_check_interval)
+
+  def test_debug_check_interval(self):
+    """Test that consistency is only checked every debug_check_interval
+    accesses, and once more at the end."""
+
+    simulation = self._make_simulation(debug_check_interval=4)
+    calls = self._count_consistency_tests(simulation)
+
+    with capture_output() as out:
+      simulation.simulate("test_traces/local_trace.out")
+
+    # The trace has 14 accesses, so it is checked after accesses 4, 8, and 12,
+    # and then at the end.
+    self.assertEqual(calls[0], 4)
+    self.assertNotIn("ERROR", out[0])
+
+    # Checking less often does not change the simulation.
+    slot = simulation.caches[0].cache_lines[6]
+    self.assertEqual(slot.state, SlotState.MODIFIED)
+    self.assertEqual(slot.tag, 6)
+
+  def test_final_consistency_check(self):
+    """Test that an inconsistency is caught at the end of the simulation, even
+    if no check is due."""
+
+    simulation = self._make_simulation(debug_check_interval=100)
+    calls = self._count_consistency_tests(simulation)
+
+    # Put slot 7, which the trace never touches, into an inconsistent state.
+    for cache in simulation.caches[1:3]:
+      cache.cache_lines[7].tag = 0
+      cache.cache_lines[7].state = SlotState.MODIFIED
+
+    with capture_output() as out:
+      simulation.simulate("test_traces/local_trace.out")
+
+    self.assertEqual(calls[0], 1)
+    self.assertIn("ERROR: Caches inconsistent.", out[0])
+
+  def test_invalid_debug_check_interval(self):
+    """Test that a debug_check_interval below 1 is rejected."""
+
+    for interval in (0, -1):
+      with self.subTest(interval=interval):
+        with self.assertRaises(ValueError):
+          self._make_simulation(debug_check_interval=interval)
+
   def test_local_behaviour(self):
     with capture_output():
       self.simulation.simulate("test_traces/local_trace.out")
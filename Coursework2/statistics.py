@@ -1,4 +1,4 @@
-from caching import SlotState
+from caching import INVALID
 import collections
 
 
@@ -73,11 +73,29 @@ class SimulationStatisticsTracker:
   def __init__(self):
     self.caches = {}
 
+    # Map from each cache_id to a tuple of the other registered caches, which
+    # are checked on every access to classify it.
+    self._other_caches = {}
+
   def add_cache(self, cache):
     """Register a cache with the tracker."""
 
+    for (cache_id, others) in list(self._other_caches.items()):
+      if cache_id != cache.cache_id:
+        self._other_caches[cache_id] = others + (cache,)
+    self._other_caches[cache.cache_id] = tuple(cache_stats.cache
+        for cache_stats in self.caches.values()
+        if cache_stats.cache.cache_id != cache.cache_id)
+
     self.caches[cache.cache_id] = CacheStatistics(cache)
 
+  def clear(self):
+    """Discards all of the statistics gathered so far, keeping the caches
+    registered."""
+
+    for (cache_id, cache_stats) in self.caches.items():
+      self.caches[cache_id] = CacheStatistics(cache_stats.cache)
+
   def read_hit(self, cache_id, address, tag, slot_id):
     """Notify the tracker of a read hit for a particular cache."""
 
@@ -85,7 +103,8 @@ class SimulationStatisticsTracker:
     line = (tag, slot_id)
 
     cache_stats.read_hits += 1
-    self._handle_read(cache_stats, address, line)
+    cache_stats.read_lines.add(line)
+    self._handle_access(cache_stats, address, line)
 
   def read_miss(self, cache_id, address, tag, slot_id, coherence_miss):
     """Notify the tracker of a read miss for a particular cache."""
@@ -96,7 +115,8 @@ class SimulationStatisticsTracker:
     cache_stats.read_misses += 1
     if coherence_miss:
       cache_stats.coherence_misses += 1
-    self._handle_read(cache_stats, address, line)
+    cache_stats.read_lines.add(line)
+    self._handle_access(cache_stats, address, line)
 
   def write_hit(self, cache_id, address, tag, slot_id):
     """Notify the tracker of a write hit for a particular cache."""
@@ -105,7 +125,8 @@ class SimulationStatisticsTracker:
     line = (tag, slot_id)
 
     cache_stats.write_hits += 1
-    self._handle_write(cache_stats, address, line)
+    cache_stats.written_lines.add(line)
+    self._handle_access(cache_stats, address, line)
 
   def write_miss(self, cache_id, address, tag, slot_id, coherence_miss):
     """Notify the tracker of a write miss for a particular cache."""
@@ -116,7 +137,8 @@ class SimulationStatisticsTracker:
     cache_stats.write_misses += 1
     if coherence_miss:
       cache_stats.coherence_misses += 1
-    self._handle_write(cache_stats, address, line)
+    cache_stats.written_lines.add(line)
+    self._handle_access(cache_stats, address, line)
 
   def get_cache_stats(self, cache_id):
     """Return a dictionary with statistics for a given cache."""
@@ -187,32 +209,20 @@ class SimulationStatisticsTracker:
     static_public_read_write_accesses = sum(
       [cs.static_public_read_write_accesses for cs in caches_stats])
 
-    # Compute the addresses accessed by 1, 2, and >2 processes.
-    all_accessed_addresses = set()
+    # Compute the addresses accessed by 1, 2, and >2 processes. Each cache's
+    # set holds an address at most once, so counting the addresses across all
+    # of the sets gives the number of processors which accessed each one.
+    address_counts = collections.Counter()
     for cache_stats in self.caches.values():
-      all_accessed_addresses = all_accessed_addresses.union(
-          cache_stats.accessed_addresses)
-    number_addresses = float(len(all_accessed_addresses))
-
-    # Count how many processors accessed each address.
-    address_counts = collections.defaultdict(int)
-    for address in all_accessed_addresses:
-      for cache_stats in self.caches.values():
-        if address in cache_stats.accessed_addresses:
-          address_counts[address] += 1
-
-    # Then filter to get each set.
-    one_proc_addresses = filter(lambda x : address_counts[x] == 1,
-        all_accessed_addresses)
-    two_proc_addresses = filter(lambda x : address_counts[x] == 2,
-        all_accessed_addresses)
-    more_than_two_proc_addresses = filter(lambda x : address_counts[x] > 2,
-        all_accessed_addresses)
-
-    # Finally, count.
-    addressed_by_one_processor = len(one_proc_addresses)
-    addressed_by_two_processors = len(two_proc_addresses)
-    addressed_by_more_than_two_processors = len(more_than_two_proc_addresses)
+      address_counts.update(cache_stats.accessed_addresses)
+    number_addresses = float(len(address_counts))
+
+    # Then count how many addresses were accessed by each number of processors.
+    processor_counts = collections.Counter(address_counts.values())
+    addressed_by_one_processor = processor_counts[1]
+    addressed_by_two_processors = processor_counts[2]
+    addressed_by_more_than_two_processors = (len(address_counts) -
+        addressed_by_one_processor - addressed_by_two_processors)
 
     # Fill up the dictionary.
     stats = {}
@@ -234,49 +244,30 @@ class SimulationStatisticsTracker:
 
     return stats
 
-  def _handle_read(self, cache_stats, address, line):
-    """Handles statistics updates regarding a generic read."""
-
-    cache_stats.read_lines.add(line)
-
-    self._handle_access(cache_stats, address, line)
-
-  def _handle_write(self, cache_stats, address, line):
-    """Handles statistics updates regarding a generic write."""
-
-    cache_stats.written_lines.add(line)
-
-    self._handle_access(cache_stats, address, line)
-
   def _handle_access(self, cache_stats, address, line):
-    """Handles statistics updates regarding a generic access."""
+    """Handles statistics updates regarding a generic access.
+
+    The read and write entry points update their own counters and line sets
+    directly, so that each access makes only this one further call."""
 
     cache_stats.accessed_addresses.add(address)
     cache_stats.access_counts[line] += 1
 
-    issuing_cache_id = cache_stats.cache.cache_id
-
     (tag, slot) = line
 
-    # Track dynamic access statistics.
-    other_slots = []
-    for other_cache_stats in self.caches.values():
-      if other_cache_stats.cache.cache_id == issuing_cache_id:
-        # Don't count self!
-        continue
-
-      other_cache_line = other_cache_stats.cache.get_cache_line(slot)
-      if (other_cache_line.state != SlotState.INVALID and
-          other_cache_line.tag == tag):
-        other_slots.append(other_cache_line)
+    # Track dynamic access statistics, against every cache but the issuing one.
+    other_caches = [other_cache
+        for other_cache in self._other_caches[cache_stats.cache.cache_id]
+        if other_cache.states[slot] != INVALID and
+            other_cache.tags[slot] == tag]
 
     # Determine the type of access: private, read-write, or read-only.
-    if len(other_slots) == 0:
+    if len(other_caches) == 0:
       cache_stats.dynamic_private_accesses += 1
     else:
       # Check whether any cache has written to the slot.
-      remote_written = any(map(lambda x : x.written_to, other_slots))
-      local_written = cache_stats.cache.get_cache_line(slot).written_to
+      remote_written = any(map(lambda x : x.written_to[slot], other_caches))
+      local_written = cache_stats.cache.written_to[slot]
       if remote_written or local_written:
         cache_stats.dynamic_public_read_write_accesses += 1
       else:
@@ -291,7 +282,7 @@ class SimulationStatisticsTracker:
     # all of the lines accessed by the given cache, excepting ones also
     # accessed by other caches.
     cache_lines = cache_stats.accessed_lines
-    for (other_cache_id, other_cache_stats) in self.caches.iteritems():
+    for (other_cache_id, other_cache_stats) in self.caches.items():
       if cache_id == other_cache_id:
         # Dont count self!
         continue
@@ -314,7 +305,7 @@ class SimulationStatisticsTracker:
     # To compute shared read-only lines we must first determine what lines
     # are read-only by *any* other cache.    
     other_read_only_lines = set()
-    for (other_cache_id, other_cache_stats) in self.caches.iteritems():
+    for (other_cache_id, other_cache_stats) in self.caches.items():
       if cache_id == other_cache_id:
         continue
 
@@ -344,7 +335,7 @@ class SimulationStatisticsTracker:
     # To compute shared read-write lines we must first determine what lines
     # are accessed at all by any other cache. 
     other_accessed_lines = set()
-    for (other_cache_id, other_cache_stats) in self.caches.iteritems():
+    for (other_cache_id, other_cache_stats) in self.caches.items():
       if cache_id == other_cache_id:
         continue
 
@@ -14,20 +14,68 @@ class StatisticsTest(unittest.TestCase):
   _NUMBER_OF_CACHE_LINES = 128
   _SIZE_OF_CACHE_LINE = 4
 
-  def setUp(self):
-    self.tracker = SimulationStatisticsTracker()
-    self.bus = Bus()
-
-    self.caches = []
+  # The accesses of test_address_tracking's first part, but with the access
+  # types changed and the sequence jumbled.
+  _JUMBLED_ADDRESS_TRACE = (
+    (0, "R", 5), (3, "W", 6), (3, "W", 6), (3, "R", 8), (0, "W", 0),
+    (0, "R", 5), (1, "R", 1), (2, "R", 6), (3, "W", 7), (3, "R", 3),
+    (1, "R", 7), (1, "R", 8), (2, "R", 8), (0, "R", 7), (3, "W", 7),
+    (0, "R", 8), (2, "W", 2), (1, "W", 5), (1, "W", 7),
+  )
+
+  @classmethod
+  def setUpClass(cls):
+    # The caches are only built once, and then cleared before each test.
+    cls.tracker = SimulationStatisticsTracker()
+    cls.bus = Bus()
+
+    cls.caches = []
     for i in range(4):
         cache = Cache(
             i, # Cache id
             StatisticsTest._NUMBER_OF_CACHE_LINES,
             StatisticsTest._SIZE_OF_CACHE_LINE,
-            self.bus,
-            self.tracker,
+            cls.bus,
+            cls.tracker,
             debug_mode=False)
-        self.caches.append(cache)
+        cls.caches.append(cache)
+
+  def setUp(self):
+    for cache in self.caches:
+      cache.clear()
+    self.bus.clear()
+    self.tracker.clear()
+
+  def _assert_counters(self, cache_stats, **expected):
+    """Asserts that the given counters of cache_stats have the expected values.
+
+    All of the counters are compared at once, so a failure shows every
+    counter that differs."""
+
+    actual = dict((name, getattr(cache_stats, name)) for name in expected)
+    self.assertEqual(actual, expected)
+
+  def _run_trace(self, cache_stats, trace):
+    """Simulates a trace of accesses, checking counters along the way.
+
+    The trace is a list of (accesses, expected) steps. For each step, the
+    accesses, each a (cache id, "R" or "W", address) tuple, are simulated in
+    order and then the counters of cache_stats are checked against the expected
+    dictionary."""
+
+    for (accesses, expected) in trace:
+      self._replay(accesses)
+      self._assert_counters(cache_stats, **expected)
+
+  def _replay(self, accesses):
+    """Simulates a list of accesses, each a (cache id, "R" or "W", address)
+    tuple, in order."""
+
+    for (cache_id, access_type, address) in accesses:
+      if access_type == "R":
+        self.caches[cache_id].read(address)
+      else:
+        self.caches[cache_id].write(address)
 
   def test_initialization(self):
     """Test that a SimulationStatisticsTracker is initialized properly."""
@@ -46,90 +94,49 @@ class StatisticsTest(unittest.TestCase):
     #   MODIFIED + read ==> read_hit + MODIFIED.
     #   MODIFIED + write ==> write_hit + MODIFIED.
 
-    cache = self.caches[0]
-    cache_stats = self.tracker.caches[0]
-
-    # Initial test.
-    self.assertEqual(cache_stats.hits, 0)
-    self.assertEqual(cache_stats.read_hits, 0)
-    self.assertEqual(cache_stats.write_hits, 0)
-    self.assertEqual(cache_stats.misses, 0)
-    self.assertEqual(cache_stats.read_misses, 0)
-    self.assertEqual(cache_stats.write_misses, 0)
-
-    cache.read(0) # Read miss to INVALID.
-    self.assertEqual(cache_stats.hits, 0)
-    self.assertEqual(cache_stats.read_hits, 0)
-    self.assertEqual(cache_stats.write_hits, 0)
-    self.assertEqual(cache_stats.misses, 1)
-    self.assertEqual(cache_stats.read_misses, 1)
-    self.assertEqual(cache_stats.write_misses, 0)
-
-    cache.write(4) # Write miss to INVALID.
-    self.assertEqual(cache_stats.hits, 0)
-    self.assertEqual(cache_stats.read_hits, 0)
-    self.assertEqual(cache_stats.write_hits, 0)
-    self.assertEqual(cache_stats.misses, 2)
-    self.assertEqual(cache_stats.read_misses, 1)
-    self.assertEqual(cache_stats.write_misses, 1)
-
-    cache.read(1) # Read hit to SHARED.
-    self.assertEqual(cache_stats.hits, 1)
-    self.assertEqual(cache_stats.read_hits, 1)
-    self.assertEqual(cache_stats.write_hits, 0)
-    self.assertEqual(cache_stats.misses, 2)
-    self.assertEqual(cache_stats.read_misses, 1)
-    self.assertEqual(cache_stats.write_misses, 1)
-
-    cache.write(2) # Write miss to SHARED.
-    self.assertEqual(cache_stats.hits, 1)
-    self.assertEqual(cache_stats.read_hits, 1)
-    self.assertEqual(cache_stats.write_hits, 0)
-    self.assertEqual(cache_stats.misses, 3)
-    self.assertEqual(cache_stats.read_misses, 1)
-    self.assertEqual(cache_stats.write_misses, 2)
-
-    cache.read(0) # Read hit to MODIFIED.
-    self.assertEqual(cache_stats.hits, 2)
-    self.assertEqual(cache_stats.read_hits, 2)
-    self.assertEqual(cache_stats.write_hits, 0)
-    self.assertEqual(cache_stats.misses, 3)
-    self.assertEqual(cache_stats.read_misses, 1)
-    self.assertEqual(cache_stats.write_misses, 2)
-
-    cache.write(0) # Write hit to MODIFIED.
-    self.assertEqual(cache_stats.hits, 3)
-    self.assertEqual(cache_stats.read_hits, 2)
-    self.assertEqual(cache_stats.write_hits, 1)
-    self.assertEqual(cache_stats.misses, 3)
-    self.assertEqual(cache_stats.read_misses, 1)
-    self.assertEqual(cache_stats.write_misses, 2)
+    self._run_trace(self.tracker.caches[0], [
+      # Initial test.
+      ([], dict(hits=0, read_hits=0, write_hits=0,
+          misses=0, read_misses=0, write_misses=0)),
+      # Read miss to INVALID.
+      ([(0, "R", 0)], dict(hits=0, read_hits=0, write_hits=0,
+          misses=1, read_misses=1, write_misses=0)),
+      # Write miss to INVALID.
+      ([(0, "W", 4)], dict(hits=0, read_hits=0, write_hits=0,
+          misses=2, read_misses=1, write_misses=1)),
+      # Read hit to SHARED.
+      ([(0, "R", 1)], dict(hits=1, read_hits=1, write_hits=0,
+          misses=2, read_misses=1, write_misses=1)),
+      # Write miss to SHARED.
+      ([(0, "W", 2)], dict(hits=1, read_hits=1, write_hits=0,
+          misses=3, read_misses=1, write_misses=2)),
+      # Read hit to MODIFIED.
+      ([(0, "R", 0)], dict(hits=2, read_hits=2, write_hits=0,
+          misses=3, read_misses=1, write_misses=2)),
+      # Write hit to MODIFIED.
+      ([(0, "W", 0)], dict(hits=3, read_hits=2, write_hits=1,
+          misses=3, read_misses=1, write_misses=2)),
+    ])
 
     # Now test a set of basic instructions, using P1.
 
-    cache = self.caches[1]
-    cache_stats = self.tracker.caches[1]
-
-    cache.read(5)    # Read miss.
-    cache.write(10)  # Write miss.
-    cache.read(11)   # Read hit.
-    cache.read(6)    # Read hit.
-    cache.read(20)   # Read miss.
-    cache.write(11)  # Write hit.
-    cache.write(7)   # Write miss.
-    cache.read(5)    # Read hit.
-    cache.read(24)   # Read miss.
-    cache.write(35)  # Write miss.
-    cache.write(24)  # Write miss.
-    cache.read(2053) # Read miss.
-    cache.read(5)    # Read miss.
-
-    self.assertEqual(cache_stats.hits, 4)
-    self.assertEqual(cache_stats.read_hits, 3)
-    self.assertEqual(cache_stats.write_hits, 1)
-    self.assertEqual(cache_stats.misses, 9)
-    self.assertEqual(cache_stats.read_misses, 5)
-    self.assertEqual(cache_stats.write_misses, 4)
+    self._run_trace(self.tracker.caches[1], [
+      ([(1, "R", 5),    # Read miss.
+        (1, "W", 10),   # Write miss.
+        (1, "R", 11),   # Read hit.
+        (1, "R", 6),    # Read hit.
+        (1, "R", 20),   # Read miss.
+        (1, "W", 11),   # Write hit.
+        (1, "W", 7),    # Write miss.
+        (1, "R", 5),    # Read hit.
+        (1, "R", 24),   # Read miss.
+        (1, "W", 35),   # Write miss.
+        (1, "W", 24),   # Write miss.
+        (1, "R", 2053), # Read miss.
+        (1, "R", 5)],   # Read miss.
+       dict(hits=4, read_hits=3, write_hits=1,
+          misses=9, read_misses=5, write_misses=4)),
+    ])
 
   def test_coherence_influenced_miss_tracking(self):
     """Test miss tracking, with coherence influences.
@@ -144,106 +151,52 @@ class StatisticsTest(unittest.TestCase):
     #   MODIFIED + remote read miss ==> SHARED.
     #   MODIFIED + remote write miss ==> INVALID.
 
-    cache0 = self.caches[0]
-    cache1 = self.caches[1]
-    cache_stats = self.tracker.caches[0]
-
-    cache1.read(1) # Remote read miss to INVALID line. 
-    self.assertEqual(cache_stats.hits, 0)
-    self.assertEqual(cache_stats.read_hits, 0)
-    self.assertEqual(cache_stats.write_hits, 0)
-    self.assertEqual(cache_stats.misses, 0)
-    self.assertEqual(cache_stats.read_misses, 0)
-    self.assertEqual(cache_stats.write_misses, 0)
-    self.assertEqual(cache_stats.coherence_misses, 0)
-
-    cache1.write(1) # Remote write miss to INVALID line. 
-    self.assertEqual(cache_stats.hits, 0)
-    self.assertEqual(cache_stats.read_hits, 0)
-    self.assertEqual(cache_stats.write_hits, 0)
-    self.assertEqual(cache_stats.misses, 0)
-    self.assertEqual(cache_stats.read_misses, 0)
-    self.assertEqual(cache_stats.write_misses, 0)
-    self.assertEqual(cache_stats.coherence_misses, 0)
-
-    # SHARED + remote read miss.
-    cache0.read(4) # Prime cache to SHARED.
-    cache1.read(5) # Remote read miss to the SHARED line.
-    cache0.read(4) # Should still be SHARED so hit.
-    self.assertEqual(cache_stats.hits, 1)
-    self.assertEqual(cache_stats.read_hits, 1)
-    self.assertEqual(cache_stats.write_hits, 0)
-    self.assertEqual(cache_stats.misses, 1)
-    self.assertEqual(cache_stats.read_misses, 1)
-    self.assertEqual(cache_stats.write_misses, 0)
-    self.assertEqual(cache_stats.coherence_misses, 0)
-
-    # SHARED + remote write miss.
-    cache1.write(6) # Remote write miss to the SHARED line.
-    cache0.write(6) # Should now be INVALID so miss.
-    self.assertEqual(cache_stats.hits, 1)
-    self.assertEqual(cache_stats.read_hits, 1)
-    self.assertEqual(cache_stats.write_hits, 0)
-    self.assertEqual(cache_stats.misses, 2)
-    self.assertEqual(cache_stats.read_misses, 1)
-    self.assertEqual(cache_stats.write_misses, 1)
-    self.assertEqual(cache_stats.coherence_misses, 1)
-
-    # MODIFIED + remote read miss.
-    cache1.read(7) # Remote read miss to the MODIFIED line.
-    cache0.write(4) # Should now be SHARED so miss.
-    self.assertEqual(cache_stats.hits, 1)
-    self.assertEqual(cache_stats.read_hits, 1)
-    self.assertEqual(cache_stats.write_hits, 0)
-    self.assertEqual(cache_stats.misses, 3)
-    self.assertEqual(cache_stats.read_misses, 1)
-    self.assertEqual(cache_stats.write_misses, 2)
-    self.assertEqual(cache_stats.coherence_misses, 2)
-
-    # MODIFIED + remote read miss 2.
-    cache1.read(7) # Remote read miss to the MODIFIED line.
-    cache0.read(4) # Should now be SHARED so hit.
-    self.assertEqual(cache_stats.hits, 2)
-    self.assertEqual(cache_stats.read_hits, 2)
-    self.assertEqual(cache_stats.write_hits, 0)
-    self.assertEqual(cache_stats.misses, 3)
-    self.assertEqual(cache_stats.read_misses, 1)
-    self.assertEqual(cache_stats.write_misses, 2)
-    self.assertEqual(cache_stats.coherence_misses, 2)
-
-    # MODIFIED + remote write miss.
-    cache0.write(5) # Prime cache (miss)
-    cache1.write(7) # Remote write miss to the MODIFIED line.
-    cache0.read(6) # Should now be INVALID so miss.
-    self.assertEqual(cache_stats.hits, 2)
-    self.assertEqual(cache_stats.read_hits, 2)
-    self.assertEqual(cache_stats.write_hits, 0)
-    self.assertEqual(cache_stats.misses, 5)
-    self.assertEqual(cache_stats.read_misses, 2)
-    self.assertEqual(cache_stats.write_misses, 3)
-    self.assertEqual(cache_stats.coherence_misses, 3)
-
-    # MODIFIED + remote write miss 2.
-    cache0.write(7) # Prime cache (miss)
-    cache1.write(5) # Remote write miss to the MODIFIED line.
-    cache0.write(4) # Should now be INVALID so miss.
-    self.assertEqual(cache_stats.hits, 2)
-    self.assertEqual(cache_stats.read_hits, 2)
-    self.assertEqual(cache_stats.write_hits, 0)
-    self.assertEqual(cache_stats.misses, 7)
-    self.assertEqual(cache_stats.read_misses, 2)
-    self.assertEqual(cache_stats.write_misses, 5)
-    self.assertEqual(cache_stats.coherence_misses, 4)
+    self._run_trace(self.tracker.caches[0], [
+      # Remote read miss to INVALID line.
+      ([(1, "R", 1)], dict(hits=0, read_hits=0, write_hits=0,
+          misses=0, read_misses=0, write_misses=0, coherence_misses=0)),
+      # Remote write miss to INVALID line.
+      ([(1, "W", 1)], dict(hits=0, read_hits=0, write_hits=0,
+          misses=0, read_misses=0, write_misses=0, coherence_misses=0)),
+      # SHARED + remote read miss.
+      ([(0, "R", 4),  # Prime cache to SHARED.
+        (1, "R", 5),  # Remote read miss to the SHARED line.
+        (0, "R", 4)], # Should still be SHARED so hit.
+       dict(hits=1, read_hits=1, write_hits=0,
+          misses=1, read_misses=1, write_misses=0, coherence_misses=0)),
+      # SHARED + remote write miss.
+      ([(1, "W", 6),  # Remote write miss to the SHARED line.
+        (0, "W", 6)], # Should now be INVALID so miss.
+       dict(hits=1, read_hits=1, write_hits=0,
+          misses=2, read_misses=1, write_misses=1, coherence_misses=1)),
+      # MODIFIED + remote read miss.
+      ([(1, "R", 7),  # Remote read miss to the MODIFIED line.
+        (0, "W", 4)], # Should now be SHARED so miss.
+       dict(hits=1, read_hits=1, write_hits=0,
+          misses=3, read_misses=1, write_misses=2, coherence_misses=2)),
+      # MODIFIED + remote read miss 2.
+      ([(1, "R", 7),  # Remote read miss to the MODIFIED line.
+        (0, "R", 4)], # Should now be SHARED so hit.
+       dict(hits=2, read_hits=2, write_hits=0,
+          misses=3, read_misses=1, write_misses=2, coherence_misses=2)),
+      # MODIFIED + remote write miss.
+      ([(0, "W", 5),  # Prime cache (miss)
+        (1, "W", 7),  # Remote write miss to the MODIFIED line.
+        (0, "R", 6)], # Should now be INVALID so miss.
+       dict(hits=2, read_hits=2, write_hits=0,
+          misses=5, read_misses=2, write_misses=3, coherence_misses=3)),
+      # MODIFIED + remote write miss 2.
+      ([(0, "W", 7),  # Prime cache (miss)
+        (1, "W", 5),  # Remote write miss to the MODIFIED line.
+        (0, "W", 4)], # Should now be INVALID so miss.
+       dict(hits=2, read_hits=2, write_hits=0,
+          misses=7, read_misses=2, write_misses=5, coherence_misses=4)),
+    ])
 
     # Finish off by checking P1.
-    cache_stats = self.tracker.caches[1]
-    self.assertEqual(cache_stats.hits, 0)
-    self.assertEqual(cache_stats.read_hits, 0)
-    self.assertEqual(cache_stats.write_hits, 0)
-    self.assertEqual(cache_stats.misses, 8)
-    self.assertEqual(cache_stats.read_misses, 4)
-    self.assertEqual(cache_stats.write_misses, 4)
-    self.assertEqual(cache_stats.coherence_misses, 4)
+    self._assert_counters(self.tracker.caches[1], hits=0, read_hits=0,
+        write_hits=0, misses=8, read_misses=4, write_misses=4,
+        coherence_misses=4)
 
   def test_address_tracking(self):
     """Test address tracking."""
@@ -303,25 +256,7 @@ class StatisticsTest(unittest.TestCase):
     self.setUp()
 
     # Addresses accessed as above, but access type changed and sequence jumbled.
-    self.caches[0].read(5)
-    self.caches[3].write(6)
-    self.caches[3].write(6)
-    self.caches[3].read(8)
-    self.caches[0].write(0)
-    self.caches[0].read(5)
-    self.caches[1].read(1)
-    self.caches[2].read(6)
-    self.caches[3].write(7)
-    self.caches[3].read(3)
-    self.caches[1].read(7)
-    self.caches[1].read(8)
-    self.caches[2].read(8)
-    self.caches[0].read(7)
-    self.caches[3].write(7)
-    self.caches[0].read(8)
-    self.caches[2].write(2)
-    self.caches[1].write(5)
-    self.caches[1].write(7)
+    self._replay(StatisticsTest._JUMBLED_ADDRESS_TRACE)
 
     # Compute the post-processed statistics.
     stats_dict = self.tracker.get_general_stats()
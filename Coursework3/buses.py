@@ -1,25 +1,98 @@
 """The bus module."""
 
 
-import random
-
-
-class Bus:
+class Bus(object):
   """Represents the system bus, attached to the caches."""
 
+  __slots__ = ('caches', '_others', '_read_notifiers', '_write_notifiers',
+      '_offset_bits')
+
   def __init__(self):
     self.caches = []
 
+    # Map from each cache_id to a tuple of the other caches on the bus, i.e.
+    # those which must be notified of a miss from that cache. Tuples are used as
+    # they are only rebuilt when a cache is added, but iterated on every miss.
+    self._others = {}
+
+    # As _others, but holding the bound notify_read_miss_block and
+    # notify_write_miss_block methods of the other caches, so that a miss does
+    # not have to look them up on each cache.
+    self._read_notifiers = {}
+    self._write_notifiers = {}
+
+    # The number of address bits used for the offset within a line, shared by
+    # every cache on the bus. Misses are passed to the caches as blocks (the
+    # address with these bits shifted away), computed once per miss.
+    self._offset_bits = None
+
   def add_cache(self, cache):
     """Add a cache to the bus."""
 
+    self._check_offset_bits(cache)
+
+    # Caches register themselves one at a time as they are created, so rather
+    # than rebuilding every tuple of other caches, just add the new cache to the
+    # existing tuples and build its own.
+    for cache_id, others in list(self._others.items()):
+      if cache_id != cache.cache_id:
+        self._set_others(cache_id, others + (cache,))
+    self._set_others(cache.cache_id, tuple(other for other in self.caches
+        if other.cache_id != cache.cache_id))
+
     self.caches.append(cache)
 
   def add_caches(self, new_caches):
     """Add a list of caches to the bus."""
 
     for cache in new_caches:
-      self.caches.append(cache)
+      self._check_offset_bits(cache)
+
+    # Add all of the caches, then rebuild the tuples of other caches just once.
+    self.caches.extend(new_caches)
+    self._update_others()
+
+  def _check_offset_bits(self, cache):
+    """Checks that a cache has the same line size as those already on the bus."""
+
+    if self._offset_bits is None:
+      self._offset_bits = cache.offset_bits
+    elif cache.offset_bits != self._offset_bits:
+      raise ValueError("All caches on the bus must have the same line size!")
+
+  def _update_others(self):
+    """Rebuilds the tuples of other caches for each cache on the bus."""
+
+    self._others = {}
+    self._read_notifiers = {}
+    self._write_notifiers = {}
+    for cache in self.caches:
+      self._set_others(cache.cache_id, tuple(other for other in self.caches
+          if other.cache_id != cache.cache_id))
+
+  def _set_others(self, cache_id, others):
+    """Records the tuple of other caches for a cache_id, along with their bound
+    notify methods."""
+
+    self._others[cache_id] = others
+    self._read_notifiers[cache_id] = tuple(
+        other.notify_read_miss_block for other in others)
+    self._write_notifiers[cache_id] = tuple(
+        other.notify_write_miss_block for other in others)
+
+  def _notifiers(self, notifiers, cache_id):
+    """Returns the notify methods in notifiers (_read_notifiers or
+    _write_notifiers) for a miss from cache_id.
+
+    Raises a ValueError if the cache is not on the bus, including when the bus
+    has no caches at all (and so no line size to split the address with.)"""
+
+    try:
+      return notifiers[cache_id]
+    except KeyError:
+      if not self.caches:
+        raise ValueError("There are no caches on the bus!")
+      raise ValueError("Cache %s is not on the bus!" % cache_id)
 
   def read_miss(self, cache_id, address):
     """Instruct the bus to notify the caches of a read miss to an address.
@@ -27,19 +100,21 @@ class Bus:
     The cache_id argument identifies the cache which issued the read miss;
     all caches which do not have that id are informed of the miss.
 
-    Caches are notified in a random order.
+    Caches are notified in the order they were added to the bus.
 
     Returns true if the cache line would have to be fetched from main memory."""
 
-    read_from_main_memory = True
+    # Stop as soon as one cache can supply the line. Under MSI, a cache holding
+    # the line MODIFIED is its only valid holder, and a cache holding it SHARED
+    # means no other cache holds it MODIFIED, so notifying the remaining caches
+    # could not change their state.
+    read_notifiers = self._notifiers(self._read_notifiers, cache_id)
+    block = address >> self._offset_bits
+    for notify_read_miss_block in read_notifiers:
+      if notify_read_miss_block(address, block):
+        return False
 
-    for cache in self.caches:
-      if cache.cache_id != cache_id:
-        has_address = cache.notify_read_miss(address)
-        if has_address:
-          read_from_main_memory = False
-
-    return read_from_main_memory
+    return True
 
   def write_miss(self, cache_id, address):
     """Instruct the bus to notify the caches of a write miss to an address.
@@ -47,8 +122,9 @@ class Bus:
     The cache_id argument identifies the cache which issued the write miss;
     all caches which do not have that id are informed of the miss.
 
-    Caches are notified in a random order."""
+    Caches are notified in the order they were added to the bus."""
 
-    for cache in self.caches:
-      if cache.cache_id != cache_id:
-        cache.notify_write_miss(address)
\ No newline at end of file
+    write_notifiers = self._notifiers(self._write_notifiers, cache_id)
+    block = address >> self._offset_bits
+    for notify_write_miss_block in write_notifiers:
+      notify_write_miss_block(address, block)
\ No newline at end of file
@@ -4,61 +4,107 @@
 import collections
 
 
+# The possible states for a cache slot (line). These are plain module-level
+# integers so that the state machine in Cache can compare against them without
+# an attribute lookup on SlotState.
+INVALID, SHARED, MODIFIED = range(3)
+
+# Human-readable names for the slot states, indexed by state.
+_STATE_NAMES = ("INVALID", "SHARED", "MODIFIED")
+
+# Cycle costs for latency. These are module-level so that the access paths load
+# them as globals rather than looking them up on the class.
+_L1_CACHE_COST = 2
+_BUS_COST = 20
+_MAIN_MEMORY_COST = 200
+
+# As the cache is write-through, the latency of a write is simple - every write
+# must hit the cache, the bus, and main memory.
+_WRITE_LATENCY = _L1_CACHE_COST + _BUS_COST + _MAIN_MEMORY_COST
+
+# Cost of snooping a TSO write buffer.
+_WRITE_BUFFER_COST = 1
+
+
 class SlotState(object):
-  """An enumeration representing the possible states for a cache slot (line)."""
+  """An enumeration representing the possible states for a cache slot (line).
 
-  INVALID, SHARED, MODIFIED = range(3)
+  The values are the module-level INVALID, SHARED and MODIFIED constants; this
+  class is kept so that existing users of SlotState continue to work."""
 
-  @classmethod
-  def pretty_string(cls, state):
+  INVALID, SHARED, MODIFIED = INVALID, SHARED, MODIFIED
+
+  @staticmethod
+  def pretty_string(state):
     """Return a human-readable version of an enum value."""
 
-    if state == SlotState.INVALID:
-      return "INVALID"
-    elif state == SlotState.SHARED:
-      return "SHARED"
-    elif state == SlotState.MODIFIED:
-      return "MODIFIED"
-    elif state == None:
+    if state is None:
       return "None"
-    else:
+    if not 0 <= state < len(_STATE_NAMES):
       raise ValueError("Unknown state %s!" % state)
+    return _STATE_NAMES[state]
 
 
 class CacheSlot(object):
-  """Represents a slot (line) in the cache.
+  """A view onto a slot (line) in the cache.
 
-  Does not store any data, only a tag and line state."""
+  The cache stores its slots as parallel lists (one per field); a CacheSlot
+  reads and writes through to those lists for a single slot id. As with the
+  cache, no data is stored, only a tag and line state."""
 
-  def __init__(self):
-    self.tag = None
-    self._state = SlotState.INVALID
-    self._prev_state = None
-    self.written_to = False
+  __slots__ = ('_cache', '_slot_id')
+
+  def __init__(self, cache, slot_id):
+    self._cache = cache
+    self._slot_id = slot_id
+
+  @property
+  def tag(self):
+    return self._cache.tags[self._slot_id]
+
+  @tag.setter
+  def tag(self, new_tag):
+    self._cache.tags[self._slot_id] = new_tag
 
   @property
   def state(self):
-    return self._state
+    return self._cache.states[self._slot_id]
 
   @state.setter
   def state(self, new_state):
-    """Update the state of the cache slot."""
+    """Update the state of the cache slot, remembering the previous state."""
 
-    self._prev_state = self._state
-    self._state = new_state
+    self.set_state(new_state)
+
+  def set_state(self, new_state):
+    """Update the state of the cache slot, remembering the previous state."""
+
+    states = self._cache.states
+    self._cache.previous_states[self._slot_id] = states[self._slot_id]
+    states[self._slot_id] = new_state
 
   @property
   def previous_state(self):
-    """The previous state of the cache slot."""
+    return self._cache.previous_states[self._slot_id]
+
+  @previous_state.setter
+  def previous_state(self, previous_state):
+    self._cache.previous_states[self._slot_id] = previous_state
+
+  @property
+  def written_to(self):
+    return self._cache.written_to[self._slot_id]
 
-    return self._prev_state
+  @written_to.setter
+  def written_to(self, written_to):
+    self._cache.written_to[self._slot_id] = written_to
 
   def __repr__(self):
     """The string representation of a cache slot."""
 
     return ("CacheSlot[state=%s, previous_state=%s, tag=%s, written_to=%s" %
-        (SlotState.pretty_string(self._state),
-        SlotState.pretty_string(self._prev_state),
+        (SlotState.pretty_string(self.state),
+        SlotState.pretty_string(self.previous_state),
         self.tag,
         self.written_to))
 
@@ -69,13 +115,15 @@ class Cache(object):
   A cache is defined by the number of lines in the cache, and the size of each
   line (given in number of words.)"""
 
-  # Cycle costs for latency.
-  _L1_CACHE_COST = 2
-  _BUS_COST = 20
-  _MAIN_MEMORY_COST = 200
+  __slots__ = ('cache_id', 'slot_bits', 'offset_bits', '_slot_mask',
+      '_tag_shift', 'bus', 'tracker', '_bus_read_miss', '_bus_write_miss',
+      '_tracker_read_miss', '_tracker_read_hit',
+      '_tracker_write_miss', '_tracker_write_hit',
+      'states', 'previous_states', 'tags', 'written_to', 'cache_lines',
+      'latency', 'stats_mode', 'hits', 'misses', 'debug_mode', '_debug_prefix')
 
   def __init__(self, cache_id, number_lines, line_size, bus, tracker,
-      debug_mode):
+      debug_mode, stats_mode=False):
     self.cache_id = cache_id
 
     if not _is_power_of_two(number_lines):
@@ -87,20 +135,54 @@ class Cache(object):
     self.slot_bits = _integer_log_base_two(number_lines)
     self.offset_bits = _integer_log_base_two(line_size)
 
+    # Precompute how an address is split up. The offset is contained in the
+    # lowest 'offset_bits' bits, the slot id in the next 'slot_bits' bits, and
+    # the tag in the remaining bits above them. Shifting the offset bits away
+    # gives a block, from which _slot_mask selects the slot id.
+    self._slot_mask = number_lines - 1
+    self._tag_shift = self.slot_bits + self.offset_bits
+
     self.bus = bus
     self.bus.add_cache(self)
 
     self.tracker = tracker
     self.tracker.add_cache(self)
 
-    # The cache contents are represented as a dictionary from slot id to
-    # CacheSlots, which are dynamically created.
-    self.cache_lines = collections.defaultdict(CacheSlot)
+    # Bind the bus and tracker methods called on every access once, rather than
+    # looking them up each time. This means the bus and tracker methods must
+    # not be replaced after the cache has been created.
+    self._bus_read_miss = bus.read_miss
+    self._bus_write_miss = bus.write_miss
+    self._tracker_read_miss = tracker.read_miss
+    self._tracker_read_hit = tracker.read_hit
+    self._tracker_write_miss = tracker.write_miss
+    self._tracker_write_hit = tracker.write_hit
+
+    # The cache contents are represented as parallel lists indexed by slot id,
+    # one per field of a slot. All slots start out INVALID with no tag.
+    self.states = [INVALID] * number_lines
+    self.previous_states = [None] * number_lines
+    self.tags = [None] * number_lines
+    self.written_to = [False] * number_lines
+
+    # Views of each slot, created once up front rather than every time a slot
+    # is asked for.
+    self.cache_lines = [CacheSlot(self, slot_id)
+        for slot_id in range(number_lines)]
 
     # Track the cache latency.
     self.latency = 0
 
+    # Optionally count the hits and misses in this cache, so that its hit ratio
+    # can be found without going through the statistics tracker. The counters
+    # are only updated when stats_mode is on.
+    self.stats_mode = stats_mode
+    self.hits = 0
+    self.misses = 0
+
     self.debug_mode = debug_mode
+    # Indentation used to line up debug output with the "Cache <id>: " header.
+    self._debug_prefix = " " * len("Cache %s: " % cache_id)
 
   def write(self, address):
     """Handles a write to a memory address.
@@ -127,6 +209,22 @@ class Cache(object):
 
     return hit
 
+  def hit_ratio(self):
+    """Returns the fraction of accesses to the cache that hit.
+
+    Only accesses made while stats_mode is on are counted. If there have been
+    no such accesses, NaN is returned.
+
+    For a TSOCache, a read served from the write buffer counts as a hit when it
+    is made, but a buffered write is only counted once it reaches the cache,
+    when it is retired or drained. Writes still in the buffer are not counted
+    at all."""
+
+    try:
+      return float(self.hits) / (self.hits + self.misses)
+    except ZeroDivisionError:
+      return float("nan")
+
   def get_cache_line(self, slot_id):
     """Return a line in the cache.
 
@@ -134,6 +232,22 @@ class Cache(object):
 
     return self.cache_lines[slot_id]
 
+  def clear(self):
+    """Empties the cache, returning every slot to the state it was created in
+    and resetting the latency and hit/miss counts.
+
+    The cache stays attached to its bus and tracker."""
+
+    number_lines = len(self.states)
+    self.states[:] = [INVALID] * number_lines
+    self.previous_states[:] = [None] * number_lines
+    self.tags[:] = [None] * number_lines
+    self.written_to[:] = [False] * number_lines
+
+    self.latency = 0
+    self.hits = 0
+    self.misses = 0
+
   def notify_read_miss(self, address):
     """Handles an external read-miss to an address.
 
@@ -142,10 +256,23 @@ class Cache(object):
     Return True if the data would be returned by the cache, False if the cache
     didn't have the data."""
 
-    tag, slot_id, _ = self._split_address(address)
-    cache_slot = self.cache_lines[slot_id]
+    return self.notify_read_miss_block(address, address >> self.offset_bits)
+
+  def notify_read_miss_block(self, address, block):
+    """Handles an external read-miss to an address, whose block (the address
+    with the offset bits shifted away) has already been computed.
+
+    Used by the bus, which computes the block once for all of the caches it
+    notifies. Returns as notify_read_miss."""
+
+    tag = block >> self.slot_bits
+    slot_id = block & self._slot_mask
+
+    states = self.states
+    state = states[slot_id]
+    tag_match = self.tags[slot_id] == tag
 
-    if cache_slot.state == SlotState.MODIFIED and cache_slot.tag == tag:
+    if state == MODIFIED and tag_match:
       if self.debug_mode:
         print("Cache %s: Changing %s [tag=%s, slot_id=%s] from"
             " MODIFIED to SHARED." % (self.cache_id, address, tag, slot_id))
@@ -154,21 +281,33 @@ class Cache(object):
       # cache or written to main memory.
 
       # Update the cache slot.
-      cache_slot.state = SlotState.SHARED
+      self.previous_states[slot_id] = state
+      state = states[slot_id] = SHARED
 
     # If the tag matches, and the cache slot either was already SHARED or is now
     # SHARED, the data could be returned from this cache.
-    return cache_slot.tag == tag and cache_slot.state == SlotState.SHARED
+    return tag_match and state == SHARED
 
   def notify_write_miss(self, address):
     """Handles an external write-miss to an address.
 
     If the given address is cached locally, its state will be set to INVALID."""
 
-    tag, slot_id, _ = self._split_address(address)
-    cache_slot = self.cache_lines[slot_id]
+    self.notify_write_miss_block(address, address >> self.offset_bits)
 
-    if cache_slot.state != SlotState.INVALID and cache_slot.tag == tag:
+  def notify_write_miss_block(self, address, block):
+    """Handles an external write-miss to an address, whose block (the address
+    with the offset bits shifted away) has already been computed.
+
+    Used by the bus, which computes the block once for all of the caches it
+    notifies."""
+
+    tag = block >> self.slot_bits
+    slot_id = block & self._slot_mask
+
+    state = self.states[slot_id]
+
+    if state != INVALID and self.tags[slot_id] == tag:
       if self.debug_mode:
         print ("Cache %s: Changing %s [tag=%s, slot_id=%s] from"
             " MODIFIED/SHARED to INVALID." %
@@ -178,7 +317,8 @@ class Cache(object):
       # would be returned to the other cache or written to main memory.
 
       # Update the cache slot.
-      cache_slot.state = SlotState.INVALID
+      self.previous_states[slot_id] = state
+      self.states[slot_id] = INVALID
 
       # No need to update the tag or written_to status: INVALID overrides those.
 
@@ -194,277 +334,171 @@ class Cache(object):
     Returns a tuple consisting of the write latency, and whether or not the
     write hit."""
 
-    tag, slot_id, _ = self._split_address(address)
-    cache_slot = self.cache_lines[slot_id]
-
-    if self.debug_mode:
-      print ("         [tag=%s, slot_id=%s]" % (tag, slot_id))
-
-    # As the cache is write-through, the latency is simple - every write must
-    # hit the cache, the bus, and main memory.
-    write_latency = (Cache._L1_CACHE_COST + Cache._BUS_COST +
-        Cache._MAIN_MEMORY_COST)
-
-    hit = None
-
-    # There are 4 important possibilities: the slot is INVALID (miss), another
-    # memory line is in the slot (miss), the slot is SHARED (miss), or the
-    # slot is MODIFIED (hit).
-    if cache_slot.state == SlotState.INVALID:
-      if self.debug_mode:
-        prefix = " " * len("Cache %s: " % self.cache_id)
-        print prefix + "Write miss (Slot is INVALID)."
-
-      # If the slot is INVALID but the tag matches, some other processor caused
-      # us to make this miss.
-      coherence_miss = (tag == cache_slot.tag)
-      if self.debug_mode and coherence_miss:
-        print "Cache %s: Coherence miss." % self.cache_id
-
-      # Inform the statistics tracker. This must be done BEFORE informing other
-      # processors.
-      self.tracker.write_miss(self.cache_id, address, tag, slot_id,
-          coherence_miss)
-
-      # Notify the bus.
-      self.bus.write_miss(self.cache_id, address)
-
-      # In a real cache, the memory line would be loaded from main memory or
-      # other processors here.
-      
-      # Update the cache slot.
-      cache_slot.state = SlotState.MODIFIED
-      cache_slot.tag = tag
-      # We're replacing another slot, but writing to it, so written_to should be True.
-      cache_slot.written_to = True
-
-      # We missed.
-      hit = False
-
-    elif cache_slot.tag != tag:
-      if self.debug_mode:
-        prefix = " " * len("Cache %s: " % self.cache_id)
-        print prefix + "Write miss (Tag mismatch)."
+    # Only look up whether debug mode is on once.
+    debug_mode = self.debug_mode
 
-      # Inform the statistics tracker. This must be done BEFORE informing other
-      # processors.
-      self.tracker.write_miss(self.cache_id, address, tag, slot_id, False)
-
-      # Notify the bus.
-      self.bus.write_miss(self.cache_id, address)
-
-      # In a real cache, the memory line would be loaded from main memory or
-      # other processors here.
-
-      # Update the cache slot.
-      cache_slot.state = SlotState.MODIFIED
-      cache_slot.tag = tag
-      # We're replacing another slot, but writing to it, so written_to should be True.
-      cache_slot.written_to = True
-
-      # We missed.
-      hit = False
-
-    elif cache_slot.state == SlotState.SHARED:
-      if self.debug_mode:
-        prefix = " " * len("Cache %s: " % self.cache_id)
-        print prefix + "Write to SHARED."
-
-      # If the previous state was MODIFIED and the tag matches, some other
-      # processor caused us to make this miss.
-      coherence_miss = (cache_slot.previous_state == SlotState.MODIFIED and
-          tag == cache_slot.tag)
-
-      if self.debug_mode and coherence_miss:
-        print "Cache %s: Coherence miss." % self.cache_id
-
-      # Inform the statistics tracker. This must be done BEFORE informing other
-      # processors.
-      self.tracker.write_miss(self.cache_id, address, tag, slot_id,
-          coherence_miss)
-
-      # A write to shared state still counts as a miss, so other processors
-      # must be told.
-      self.bus.write_miss(self.cache_id, address)
+    if address < 0:
+      raise ValueError("address must be non-negative!")
 
-      # In a real cache, the memory line would *NOT* be loaded here, as there
-      # is no need.
+    # See Cache.__init__ for how the masks and shifts are derived.
+    tag = address >> self._tag_shift
+    slot_id = (address >> self.offset_bits) & self._slot_mask
+    states = self.states
+    state = states[slot_id]
+    tag_match = (self.tags[slot_id] == tag)
 
-      # Update the cache slot.
-      cache_slot.state = SlotState.MODIFIED
-      cache_slot.tag = tag
-      # The slot is now written to.
-      cache_slot.written_to = True
+    # Look up what happens to the slot. See _WRITE_TRANSITIONS.
+    new_state, hit, description = _WRITE_TRANSITIONS[state][tag_match]
 
-      # We missed.
-      hit = False
+    if debug_mode:
+      print ("         [tag=%s, slot_id=%s]" % (tag, slot_id))
+      print(self._debug_prefix + description)
 
-    elif cache_slot.state == SlotState.MODIFIED:
-      if self.debug_mode:
-        prefix = " " * len("Cache %s: " % self.cache_id)
-        print prefix + "Local write hit."
+    # As the cache is write-through, every write has the same latency. See
+    # _WRITE_LATENCY.
+    write_latency = _WRITE_LATENCY
 
+    if hit:
       # Inform the statistics tracker.
-      self.tracker.write_hit(self.cache_id, address, tag, slot_id)
+      self._tracker_write_hit(self.cache_id, address, tag, slot_id)
 
       # There is no need to inform the bus as the line is in MODIFIED.
 
-      # Update the cache slot anyway, so that the previous state is set
-      # correctly. The only way to get to MODIFIED is to write, so no
-      # need to set written_to.
-      cache_slot.state = cache_slot.state
-
-      # We hit!
-      hit = True
+      # Update the previous state anyway, so that it is set correctly. The only
+      # way to get to MODIFIED is to write, so no need to set written_to.
+      self.previous_states[slot_id] = state
 
-    if hit is None:
-      raise ValueError("cache_slot not in appropriate state!")
+      if self.stats_mode:
+        self.hits += 1
 
-    return write_latency, hit
+      # We hit!
+      return write_latency, True
+
+    # If the tag matches, some other processor caused us to make this miss if
+    # either it invalidated our line, or it read our MODIFIED line and so
+    # forced it to SHARED.
+    coherence_miss = tag_match and (state == INVALID or
+        self.previous_states[slot_id] == MODIFIED)
+    if debug_mode and coherence_miss:
+      print("Cache %s: Coherence miss." % self.cache_id)
+
+    # Inform the statistics tracker. This must be done BEFORE informing other
+    # processors.
+    self._tracker_write_miss(self.cache_id, address, tag, slot_id,
+        coherence_miss)
+
+    # Notify the bus. Even a write to a SHARED line counts as a miss, so other
+    # processors must be told.
+    self._bus_write_miss(self.cache_id, address)
+
+    # In a real cache, the memory line would be loaded from main memory or
+    # other processors here (unless the line was SHARED, in which case there is
+    # no need).
+
+    # Update the cache slot. Setting the tag is a no-op if it already matched.
+    self.previous_states[slot_id] = state
+    states[slot_id] = new_state
+    self.tags[slot_id] = tag
+    # Whether or not we're replacing another line, we're writing to the slot,
+    # so written_to should be True.
+    self.written_to[slot_id] = True
+
+    if self.stats_mode:
+      self.misses += 1
+
+    # We missed.
+    return write_latency, False
 
   def _process_read(self, address):
     """Processes a read instruction.
 
     Returns a tuple consisting of the read latency and whether it hit or not."""
 
-    tag, slot_id, _ = self._split_address(address)
-    cache_slot = self.cache_lines[slot_id]
-
-    if self.debug_mode:
-      print("Cache %s: Read from %s [tag=%s, slot_id=%s]" % (self.cache_id,
-          address, tag, slot_id))
-
-    # All reads access the L1 cache.
-    read_latency = Cache._L1_CACHE_COST
-
-    hit = None
-
-    # There are 3 important possibilities: the slot is INVALID (miss), another
-    # memory line is in the slot (miss), or the slot is either SHARED or
-    # MODIFIED (hit).
-    if cache_slot.state == SlotState.INVALID:
-      if self.debug_mode:
-        prefix = " " * len("Cache %s: " % self.cache_id)
-        print prefix + "Read miss (Slot is INVALID)."
-
-      # If the slot is INVALID but the tag matches, some other processor caused
-      # us to make this miss.
-      coherence_miss = (tag == cache_slot.tag)
+    # Only look up whether debug mode is on once.
+    debug_mode = self.debug_mode
 
-      # Inform the statistics tracker. This must be done BEFORE informing other
-      # processors.
-      self.tracker.read_miss(self.cache_id, address, tag, slot_id,
-          coherence_miss)
-
-      # Bus latency: 20 cycles.
-      read_latency += Cache._BUS_COST
-
-      # Notify the bus.
-      read_from_main_memory = self.bus.read_miss(self.cache_id, address)
-
-      if read_from_main_memory:
-        # Main memory latency: 200 cycles.
-        read_latency += Cache._MAIN_MEMORY_COST
-
-      # In a real cache, the memory line would be loaded from main memory or
-      # other processors here.
-
-      # Update the cache slot.
-      cache_slot.state = SlotState.SHARED
-      cache_slot.tag = tag
-      # As we're replacing another slot, reset written_to.
-      cache_slot.written_to = False
-
-      # We missed.
-      hit = False
-
-    elif cache_slot.tag != tag:
-      if self.debug_mode:
-        prefix = " " * len("Cache %s: " % self.cache_id)
-        print prefix + "Read miss (Tag mismatch)."
-
-      # Inform the statistics tracker.
-      self.tracker.read_miss(self.cache_id, address, tag, slot_id, False)
-
-      # Bus latency: 20 cycles.
-      read_latency += Cache._BUS_COST
-
-      # Notify the bus.
-      read_from_main_memory = self.bus.read_miss(self.cache_id, address)
+    if address < 0:
+      raise ValueError("address must be non-negative!")
 
-      if read_from_main_memory:
-        # Main memory latency: 200 cycles.
-        read_latency += Cache._MAIN_MEMORY_COST
+    # See Cache.__init__ for how the masks and shifts are derived.
+    tag = address >> self._tag_shift
+    slot_id = (address >> self.offset_bits) & self._slot_mask
+    states = self.states
+    state = states[slot_id]
+    tag_match = (self.tags[slot_id] == tag)
 
-      # In a real cache, the memory line would be loaded from main memory or
-      # other processors here.
+    # Look up what happens to the slot. See _READ_TRANSITIONS.
+    new_state, hit, description = _READ_TRANSITIONS[state][tag_match]
 
-      old_state = cache_slot.state
-      # Update the cache slot.
-      cache_slot.state = SlotState.SHARED
-      cache_slot.tag = tag
-      # As we're replacing another slot, reset written_to.
-      cache_slot.written_to = False
-
-      # We missed.
-      hit = False
+    if debug_mode:
+      print("Cache %s: Read from %s [tag=%s, slot_id=%s]" % (self.cache_id,
+          address, tag, slot_id))
+      print(self._debug_prefix + description)
 
-    elif (cache_slot.state == SlotState.SHARED or
-        cache_slot.state == SlotState.MODIFIED):
-      if self.debug_mode:
-        prefix = " " * len("Cache %s: " % self.cache_id)
-        print prefix + "Local read (SHARED or MODIFIED)."
+    # All reads access the L1 cache.
+    read_latency = _L1_CACHE_COST
 
+    if hit:
       # Inform the statistics tracker.
-      self.tracker.read_hit(self.cache_id, address, tag, slot_id)
+      self._tracker_read_hit(self.cache_id, address, tag, slot_id)
 
       # There is no need to inform the bus as the line is in SHARED/MODIFIED.
 
-      # Update the cache slot anyway, so that the previous state is set
-      # correctly.
-      cache_slot.state = cache_slot.state
+      # Update the previous state anyway, so that it is set correctly.
+      self.previous_states[slot_id] = state
+
+      if self.stats_mode:
+        self.hits += 1
 
       # We hit.
-      hit = True
+      return read_latency, True
 
-    if hit is None:
-      raise ValueError("cache_slot not in appropriate state!")
+    # If the slot is INVALID but the tag matches, some other processor caused
+    # us to make this miss.
+    coherence_miss = tag_match and state == INVALID
 
-    return read_latency, hit
+    # Inform the statistics tracker. This must be done BEFORE informing other
+    # processors.
+    self._tracker_read_miss(self.cache_id, address, tag, slot_id,
+        coherence_miss)
 
-  def _split_address(self, address):
-    """Splits an address into the tag, slot, and offset."""
+    # Bus latency: 20 cycles.
+    read_latency += _BUS_COST
 
-    if address < 0:
-      raise ValueError("address must be non-negative!")
+    # Notify the bus.
+    if self._bus_read_miss(self.cache_id, address):
+      # Main memory latency: 200 cycles.
+      read_latency += _MAIN_MEMORY_COST
 
-    # The offset is contained in the lowest 'self.offset_bits' bits.
-    offset_mask = (1 << self.offset_bits) - 1
-    offset = address & offset_mask
+    # In a real cache, the memory line would be loaded from main memory or
+    # other processors here.
 
-    # The slot id is contained in the middle 'self.slot_bits' bits.
-    offset_and_slot_mask = (1 << (self.slot_bits + self.offset_bits)) - 1 
-    slot = (address & offset_and_slot_mask) >> self.offset_bits
+    # Update the cache slot.
+    self.previous_states[slot_id] = state
+    states[slot_id] = new_state
+    self.tags[slot_id] = tag
+    # The line has been (re)loaded, so reset written_to.
+    self.written_to[slot_id] = False
 
-    # The tag is contained in the remaining bits above the offset and slot id.
-    tag_mask = ~offset_and_slot_mask
-    tag = (address & tag_mask) >> (self.slot_bits + self.offset_bits)
+    if self.stats_mode:
+      self.misses += 1
 
-    return tag, slot, offset
+    # We missed.
+    return read_latency, False
 
 
 class TSOCache(Cache):
   """Represents a Total Store Order (TSO) cache."""
 
-  # Cost of snooping the write buffer.
-  _WRITE_BUFFER_COST = 1
+  __slots__ = ('write_buffer', '_write_buffer_counts', 'write_buffer_size',
+      'retire_at_count', 'write_finishes_at')
 
   def __init__(self, cache_id, number_lines, line_size, bus, tracker,
-      write_buffer_size, retire_at_count, debug_mode):
+      write_buffer_size, retire_at_count, debug_mode, stats_mode=False):
 
     # Initialize parent class.
     super(TSOCache, self).__init__(cache_id, number_lines, line_size,
-        bus, tracker, debug_mode)
+        bus, tracker, debug_mode, stats_mode)
 
     if write_buffer_size <= 0:
       raise ValueError("Write buffer size must be positive!")
@@ -474,7 +508,13 @@ class TSOCache(Cache):
     if retire_at_count <= 0:
       raise ValueError("Retire-at count must be positive!")      
 
-    self.write_buffer = []
+    # The buffered write addresses, oldest first. Writes are retired from the
+    # front, so a deque is used.
+    self.write_buffer = collections.deque()
+    # How many times each address appears in the write buffer, so that reads
+    # can snoop it without scanning it. Addresses are removed when their count
+    # drops to zero.
+    self._write_buffer_counts = collections.Counter()
     self.write_buffer_size = write_buffer_size
     self.retire_at_count = retire_at_count
     self.write_finishes_at = None
@@ -495,6 +535,7 @@ class TSOCache(Cache):
       self._drain_write_buffer()
 
     self.write_buffer.append(address)
+    self._write_buffer_counts[address] += 1
 
     # Check if writes should be retired (or if the write buffer should be
     # flushed.)
@@ -511,21 +552,27 @@ class TSOCache(Cache):
     Returns true if the write hit (in the cache or write buffer), false
     otherwise."""
 
+    # Only look up whether debug mode is on once.
+    debug_mode = self.debug_mode
+
     hit = None
 
     # Snoop the write buffer.
-    self.latency += TSOCache._WRITE_BUFFER_COST
+    self.latency += _WRITE_BUFFER_COST
 
-    if self.debug_mode:
+    if debug_mode:
       print ("Cache %s: Read; snooping write buffer (latency now %s)" % (
           self.cache_id, self.latency))
 
-    if address in self.write_buffer:
-      if self.debug_mode:
+    if address in self._write_buffer_counts:
+      if debug_mode:
         print("Cache %s: Found address in write buffer." % self.cache_id)
 
       self.tracker.snoop_write_buffer(self.cache_id, address)
 
+      if self.stats_mode:
+        self.hits += 1
+
       hit = True
     else:
       # Address is not in write buffer; need to do a full read.
@@ -533,11 +580,11 @@ class TSOCache(Cache):
 
       self.latency += read_latency
 
-      if self.debug_mode:
+      if debug_mode:
         print("Cache %s: Full read (latency now %s)" % (self.cache_id,
             self.latency))
 
-    if self.debug_mode:
+    if debug_mode:
       print ("Cache %s: Read finished, checking write buffer (latency now %s, "
         "write finishes at %s)" % (self.cache_id, self.latency,
         self.write_finishes_at))
@@ -551,6 +598,29 @@ class TSOCache(Cache):
     # Process any remaining writes.
     self._drain_write_buffer()
 
+  def clear(self):
+    """Empties the cache and its write buffer.
+
+    See Cache.clear."""
+
+    super(TSOCache, self).clear()
+
+    self.write_buffer.clear()
+    self._write_buffer_counts.clear()
+    self.write_finishes_at = None
+
+  def _pop_write(self):
+    """Removes and returns the oldest write in the write buffer."""
+
+    write_address = self.write_buffer.popleft()
+
+    counts = self._write_buffer_counts
+    counts[write_address] -= 1
+    if counts[write_address] == 0:
+      del counts[write_address]
+
+    return write_address
+
   def _drain_write_buffer(self):
     """Drains the write buffer.
     
@@ -564,7 +634,8 @@ class TSOCache(Cache):
           len(self.write_buffer)))
 
     # First, check if there is a write currently processing.
-    if self.write_finishes_at > self.latency:
+    if (self.write_finishes_at is not None and
+        self.write_finishes_at > self.latency):
       if self.debug_mode:
         print("Cache %s: Updating latency to %s" % (self.cache_id,
             self.write_finishes_at))
@@ -572,17 +643,27 @@ class TSOCache(Cache):
       self.latency = self.write_finishes_at
       self.write_finishes_at = None
 
-    # Now drain the write buffer.
-    while len(self.write_buffer) > 0:
-      write_address = self.write_buffer.pop(0)
-      write_latency, _ = self._process_write(write_address)
+    # Now drain the write buffer. Every buffered write is processed, so take
+    # them all at once and empty the buffer, rather than popping them one by
+    # one.
+    write_addresses = self.write_buffer
+    self.write_buffer = collections.deque()
+    self._write_buffer_counts.clear()
+
+    debug_mode = self.debug_mode
+    process_write = self._process_write
+    latency = self.latency
+    for write_address in write_addresses:
+      write_latency, _ = process_write(write_address)
 
       # Critical path; update latency.
-      self.latency += write_latency
+      latency += write_latency
 
-      if self.debug_mode:
+      if debug_mode:
         print ("Cache %s: Processed write for drain (latency now %s)" % (
-            self.cache_id, self.latency))
+            self.cache_id, latency))
+
+    self.latency = latency
 
   def _check_write_buffer(self):
     """Checks the write buffer, processing writes if needed.
@@ -609,7 +690,7 @@ class TSOCache(Cache):
     if len(self.write_buffer) >= self.retire_at_count:
       # We can retire a write!
 
-      write_address = self.write_buffer.pop(0)
+      write_address = self._pop_write()
       write_latency, _ = self._process_write(write_address)
 
       # These writes arent on the critical path, but we must keep track of when
@@ -621,6 +702,34 @@ class TSOCache(Cache):
             write_latency, self.write_finishes_at))
 
 
+# The MSI state transitions for local accesses, indexed first by the current
+# state of the slot and then by whether the slot's tag matches the address.
+# Each entry is (new state, whether the access hits, debug description).
+_WRITE_TRANSITIONS = (
+  # INVALID
+  ((MODIFIED, False, "Write miss (Slot is INVALID)."),
+   (MODIFIED, False, "Write miss (Slot is INVALID).")),
+  # SHARED
+  ((MODIFIED, False, "Write miss (Tag mismatch)."),
+   (MODIFIED, False, "Write to SHARED.")),
+  # MODIFIED
+  ((MODIFIED, False, "Write miss (Tag mismatch)."),
+   (MODIFIED, True, "Local write hit.")),
+)
+
+_READ_TRANSITIONS = (
+  # INVALID
+  ((SHARED, False, "Read miss (Slot is INVALID)."),
+   (SHARED, False, "Read miss (Slot is INVALID).")),
+  # SHARED
+  ((SHARED, False, "Read miss (Tag mismatch)."),
+   (SHARED, True, "Local read (SHARED or MODIFIED).")),
+  # MODIFIED
+  ((SHARED, False, "Read miss (Tag mismatch)."),
+   (MODIFIED, True, "Local read (SHARED or MODIFIED).")),
+)
+
+
 def _is_power_of_two(num):
   """Determines if a given number is a power of 2 or not."""
 
@@ -635,8 +744,5 @@ def _integer_log_base_two(num):
   if not _is_power_of_two(num):
     raise ValueError("Argument is not a power of 2!")
 
-  answer = 0
-  while 2**answer <= num:
-    answer += 1
-
-  return answer - 1
+  # For a power of 2, the log is the position of its single set bit.
+  return num.bit_length() - 1
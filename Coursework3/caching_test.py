@@ -1,42 +1,47 @@
 """Tests for the caching module."""
 
+import collections
 import contextlib
-from cStringIO import StringIO
+import os
 import sys
 import unittest
 
+from buses import Bus
 from caching import Cache, TSOCache, SlotState
 from parse_trace import SimulationEnvironment
 
 
-"""A context manager that allows us to capture print statements, i.e.
+"""A context manager that discards print statements, for when the output is
+not needed, i.e.
 
->> with capture_output() as out:
->>   print "Hello, World!"
->> out
-['Hello, World!\n', '']
+>> with silence_output():
+>>   print("Hello, World!")
 """
 @contextlib.contextmanager
-def capture_output():
+def silence_output():
   old_out, old_err = sys.stdout, sys.stderr
-  try:
-    out = [StringIO(), StringIO()]
-    sys.stdout, sys.stderr = out
-    yield out
-  finally:
-    sys.stdout, sys.stdout = old_out, old_err
-    out[0] = out[0].getvalue()
-    out[1] = out[1].getvalue()
+  with open(os.devnull, "w") as devnull:
+    try:
+      sys.stdout, sys.stderr = devnull, devnull
+      yield
+    finally:
+      sys.stdout, sys.stderr = old_out, old_err
 
 
 class FakeBus():
-  """A fake implementation of the bus to be injected."""
+  """A fake implementation of the bus to be injected.
+
+  By default, read misses are satisfied by another processor; set
+  force_memory_miss to claim that they had to go to main memory instead."""
+
+  def __init__(self):
+    self.force_memory_miss = False
 
   def add_cache(self, cache):
     pass
 
   def read_miss(self, cache_id, address):
-    return False
+    return self.force_memory_miss
 
   def write_miss(self, cache_id, address):
     return False
@@ -78,36 +83,73 @@ class CachingTest(unittest.TestCase):
   _NUMBER_OF_CACHE_LINES = 128
   _SIZE_OF_CACHE_LINE = 4
 
-  def setUp(self):
-    self.fake_bus = FakeBus()
-    self.fake_tracker = FakeTracker()
+  @classmethod
+  def setUpClass(cls):
+    # The default cache is only built once, and then cleared before each test.
+    cls.fake_bus = FakeBus()
+    cls.fake_tracker = FakeTracker()
 
-    self.default_cache = Cache(
+    cls.default_cache = Cache(
         0, # Cache id.
         CachingTest._NUMBER_OF_CACHE_LINES,
         CachingTest._SIZE_OF_CACHE_LINE,
-        self.fake_bus,
-        self.fake_tracker,
+        cls.fake_bus,
+        cls.fake_tracker,
         debug_mode=False)
 
-    # Simulations for the test_trace tests.
-    self.sc_simulation = SimulationEnvironment(
+  def setUp(self):
+    self.default_cache.clear()
+    self.fake_bus.force_memory_miss = False
+
+  def _sc_simulation(self, debug_check_interval=1):
+    """Creates a simulation for the SC test_trace tests.
+
+    Only the test_trace tests need a simulation, so rather than every test
+    building one in setUp, they create their own."""
+
+    return SimulationEnvironment(
       CachingTest._NUMBER_OF_PROCESSORS,
       CachingTest._NUMBER_OF_CACHE_LINES,
       CachingTest._SIZE_OF_CACHE_LINE,
       "SC",
       debug_mode=True, # Turn on to force consistency checks.
-    )
+      debug_check_interval=debug_check_interval)
+
+  def _tso_simulation(self, debug_check_interval=1):
+    """Creates a simulation for the TSO test_trace tests."""
 
-    self.tso_simulation = SimulationEnvironment(
+    return SimulationEnvironment(
       CachingTest._NUMBER_OF_PROCESSORS,
       CachingTest._NUMBER_OF_CACHE_LINES,
       CachingTest._SIZE_OF_CACHE_LINE,
       "TSO",
       debug_mode=True, # Turn on to force consistency checks.
+      debug_check_interval=debug_check_interval,
       write_buffer_size=32,
       retire_at_count=1)
 
+  def _record_consistency_tests(self, simulation):
+    """Wraps simulation._test_consistency so that each call is recorded.
+
+    Returns a list which gets, for each call, the result of the check and the
+    number of writes left in each cache's write buffer at the time."""
+
+    calls = []
+    test_consistency = simulation._test_consistency
+    def recording_test_consistency():
+      consistent = test_consistency()
+      calls.append((consistent, [len(getattr(cache, "write_buffer", ()))
+          for cache in simulation.caches]))
+      return consistent
+    simulation._test_consistency = recording_test_consistency
+    return calls
+
+  def _set_write_buffer(self, cache, addresses):
+    """Fakes the contents of a TSO cache's write buffer, oldest write first."""
+
+    cache.write_buffer = collections.deque(addresses)
+    cache._write_buffer_counts = collections.Counter(addresses)
+
   def test_initialization(self):
     """Tests that a Cache is initialized properly."""
 
@@ -154,64 +196,36 @@ class CachingTest(unittest.TestCase):
     of interest. The check for SHARED is only to make sure that the line
     is actually in the cache."""
 
-    # First test the default setup: 128 lines, 4 words per line.
-
-    # Address 5: slot 1, tag 0.
-    self.default_cache.read(5)
-    line = self.default_cache.get_cache_line(1)
-    self.assertEqual(line.state, SlotState.SHARED)
-    self.assertEqual(line.tag, 0)
-
-    # Address 522: slot 2, tag 1.
-    self.default_cache.read(522)
-    line = self.default_cache.get_cache_line(2)
-    self.assertEqual(line.state, SlotState.SHARED)
-    self.assertEqual(line.tag, 1)
-
-    # Address 523: still slot 2, tag 1.
-    self.default_cache.read(523)
-    line = self.default_cache.get_cache_line(2)
-    self.assertEqual(line.state, SlotState.SHARED)
-    self.assertEqual(line.tag, 1)
+    # Each case is (address, expected slot, expected tag), read in order.
 
-    # Address 2571: also slot 2, but tag 5.
-    self.default_cache.read(2571)
-    line = self.default_cache.get_cache_line(2)
-    self.assertEqual(line.state, SlotState.SHARED)
-    self.assertEqual(line.tag, 5)
+    # First test the default setup: 128 lines, 4 words per line.
+    self._check_address_placement(self.default_cache, [
+      (5, 1, 0),
+      (522, 2, 1),
+      (523, 2, 1),    # Still slot 2, tag 1.
+      (2571, 2, 5),   # Also slot 2, but tag 5.
+    ])
 
     # Now test another cache: 16 lines, 8 words per line.
     cache = Cache(1, 16, 8, self.fake_bus, self.fake_tracker, debug_mode=False)
-
-    # Address 5: slot 0, tag 0.
-    cache.read(5)
-    line = cache.get_cache_line(0)
-    self.assertEqual(line.state, SlotState.SHARED)
-    self.assertEqual(line.tag, 0)
-
-    # Address 522: slot 1, tag 4.
-    cache.read(522)
-    line = cache.get_cache_line(1)
-    self.assertEqual(line.state, SlotState.SHARED)
-    self.assertEqual(line.tag, 4)
-
-    # Address 527: still slot 1, tag 4.
-    cache.read(527)
-    line = cache.get_cache_line(1)
-    self.assertEqual(line.state, SlotState.SHARED)
-    self.assertEqual(line.tag, 4)
-
-    # Address 528: slot 2, still tag 4.
-    cache.read(528)
-    line = cache.get_cache_line(2)
-    self.assertEqual(line.state, SlotState.SHARED)
-    self.assertEqual(line.tag, 4)
-
-    # Address 2571: also slot 1, but tag 20.
-    cache.read(2571)
-    line = cache.get_cache_line(1)
-    self.assertEqual(line.state, SlotState.SHARED)
-    self.assertEqual(line.tag, 20)
+    self._check_address_placement(cache, [
+      (5, 0, 0),
+      (522, 1, 4),
+      (527, 1, 4),    # Still slot 1, tag 4.
+      (528, 2, 4),    # Slot 2, still tag 4.
+      (2571, 1, 20),  # Also slot 1, but tag 20.
+    ])
+
+  def _check_address_placement(self, cache, cases):
+    """Reads each (address, slot, tag) case in order, checking that the line
+    read is placed in the expected slot with the expected tag."""
+
+    for (address, slot_id, tag) in cases:
+      with self.subTest(address=address):
+        cache.read(address)
+        line = cache.get_cache_line(slot_id)
+        self.assertEqual(line.state, SlotState.SHARED)
+        self.assertEqual(line.tag, tag)
 
   def test_local_accesses(self):
     """Tests that local accesses adhere to the MSI protocol."""
@@ -224,81 +238,56 @@ class CachingTest(unittest.TestCase):
     #   MODIFIED + read ==> read_hit + MODIFIED.
     #   MODIFIED + write ==> write_hit + MODIFIED.
 
-    # INVALID + read.
-    hit = self.default_cache.read(10)
-    self.assertFalse(hit)
-    line = self.default_cache.get_cache_line(2) # Address 10 ==> slot 2.
-    self.assertEqual(line.state, SlotState.SHARED)
-    self.assertFalse(line.written_to)
-
-    # INVALID + write.
-    hit = self.default_cache.write(20)
-    self.assertFalse(hit)
-    line = self.default_cache.get_cache_line(5) # Address 20 ==> slot 5.
-    self.assertEqual(line.state, SlotState.MODIFIED)
-    self.assertTrue(line.written_to)
-
-    # SHARED + read.
-    self.default_cache.read(30) # Prime the cache.
-    hit = self.default_cache.read(31)
-    self.assertTrue(hit)
-    line = self.default_cache.get_cache_line(7) # Address 31 ==> slot 7.
-    self.assertEqual(line.state, SlotState.SHARED)
-    self.assertFalse(line.written_to)
-
-    # SHARED + write.
-    self.default_cache.read(40) # Prime the cache.
-    hit = self.default_cache.write(41)
-    self.assertFalse(hit)
-    line = self.default_cache.get_cache_line(10) # Address 41 ==> slot 10.
-    self.assertEqual(line.state, SlotState.MODIFIED)
-    self.assertTrue(line.written_to)
-
-    # MODIFIED + read
-    self.default_cache.write(50) # Prime the cache.
-    hit = self.default_cache.read(51)
-    self.assertTrue(hit)
-    line = self.default_cache.get_cache_line(12) # Address 51 ==> slot 12.
-    self.assertEqual(line.state, SlotState.MODIFIED)
-    self.assertTrue(line.written_to)
-
-    # MODIFIED + write
-    self.default_cache.write(60) # Prime the cache.
-    hit = self.default_cache.write(61)
-    self.assertTrue(hit)
-    line = self.default_cache.get_cache_line(15) # Address 61 ==> slot 15.
-    self.assertEqual(line.state, SlotState.MODIFIED)
-    self.assertTrue(line.written_to)
-
-    # Mismatching tags in any non-INVALID state should be equivalent to INVALID.
-
-    # SHARED + read.
-    self.default_cache.read(30) # Prime the cache.
-    hit = self.default_cache.read(2590) # Access a different tag.
-    self.assertFalse(hit)
-    line = self.default_cache.get_cache_line(7) # Address 30|2590 ==> slot 7.
-    self.assertFalse(line.written_to)
-
-    # SHARED + write.
-    self.default_cache.read(40) # Prime the cache.
-    hit = self.default_cache.write(10280) # Access a different tag.
-    self.assertFalse(hit)
-    line = self.default_cache.get_cache_line(10) # Address 40|10280 ==> slot 10.
-    self.assertTrue(line.written_to)
-
-    # MODIFIED + read
-    self.default_cache.write(50) # Prime the cache.
-    hit = self.default_cache.read(5682) # Access a different tag.
-    self.assertFalse(hit)
-    line = self.default_cache.get_cache_line(12) # Address 50|5682 ==> slot 12.
-    self.assertFalse(line.written_to) # 5682 has only been read.
-
-    # MODIFIED + write
-    self.default_cache.write(60) # Prime the cache.
-    hit = self.default_cache.write(1596) # Access a different tag.
-    self.assertFalse(hit)
-    line = self.default_cache.get_cache_line(15) # Address 60|1596 ==> slot 12.
-    self.assertTrue(line.written_to)
+    # Each case is (description, priming access, access, slot, expected hit,
+    # expected state, expected written_to), where accesses are ("R" or "W",
+    # address). The cache is cleared before each case.
+    cases = [
+      ("INVALID + read", None, ("R", 10), 2, False, SlotState.SHARED, False),
+      ("INVALID + write", None, ("W", 20), 5, False, SlotState.MODIFIED, True),
+      ("SHARED + read", ("R", 30), ("R", 31), 7,
+          True, SlotState.SHARED, False),
+      ("SHARED + write", ("R", 40), ("W", 41), 10,
+          False, SlotState.MODIFIED, True),
+      ("MODIFIED + read", ("W", 50), ("R", 51), 12,
+          True, SlotState.MODIFIED, True),
+      ("MODIFIED + write", ("W", 60), ("W", 61), 15,
+          True, SlotState.MODIFIED, True),
+
+      # Mismatching tags in any non-INVALID state should be equivalent to
+      # INVALID.
+      ("SHARED + read, tag mismatch", ("R", 30), ("R", 2590), 7,
+          False, SlotState.SHARED, False),
+      ("SHARED + write, tag mismatch", ("R", 40), ("W", 10280), 10,
+          False, SlotState.MODIFIED, True),
+      # 5682 has only been read.
+      ("MODIFIED + read, tag mismatch", ("W", 50), ("R", 5682), 12,
+          False, SlotState.SHARED, False),
+      ("MODIFIED + write, tag mismatch", ("W", 60), ("W", 1596), 15,
+          False, SlotState.MODIFIED, True),
+    ]
+
+    for (description, prime, access, slot_id, expected_hit, expected_state,
+        expected_written_to) in cases:
+      with self.subTest(description):
+        self.default_cache.clear()
+        if prime is not None:
+          self._access(self.default_cache, prime)
+
+        hit = self._access(self.default_cache, access)
+        self.assertEqual(hit, expected_hit)
+        line = self.default_cache.get_cache_line(slot_id)
+        self.assertEqual(line.state, expected_state)
+        self.assertEqual(line.written_to, expected_written_to)
+
+  def _access(self, cache, access):
+    """Performs an access, given as ("R" or "W", address), on a cache.
+
+    Returns whether the access hit."""
+
+    (access_type, address) = access
+    if access_type == "R":
+      return cache.read(address)
+    return cache.write(address)
 
   def test_remote_accesses(self):
     """Tests that remote accesses adhere to the MSI protocol."""
@@ -410,6 +399,100 @@ class CachingTest(unittest.TestCase):
     line = self.default_cache.get_cache_line(15) # Address 60 ==> slot 15
     self.assertTrue(line.written_to)
 
+  def test_hit_ratio(self):
+    """Tests the optional hit and miss counters."""
+
+    # Counters are off by default.
+    self.default_cache.read(0)
+    self.default_cache.read(0)
+    self.assertEqual(self.default_cache.hits, 0)
+    self.assertEqual(self.default_cache.misses, 0)
+    self.assertNotEqual(self.default_cache.hit_ratio(),
+        self.default_cache.hit_ratio()) # NaN.
+
+    cache = Cache(1, 128, 4, self.fake_bus, self.fake_tracker,
+        debug_mode=False, stats_mode=True)
+
+    cache.read(0)  # Read miss.
+    cache.read(1)  # Read hit.
+    cache.write(2) # Write miss (SHARED).
+    cache.write(3) # Write hit.
+    self.assertEqual(cache.hits, 2)
+    self.assertEqual(cache.misses, 2)
+    self.assertEqual(cache.hit_ratio(), 0.5)
+
+    # Cache with 128 lines, 4 words/line, 4-write buffer with retire-at-2.
+    cache = TSOCache(2, 128, 4, self.fake_bus, self.fake_tracker, 4, 2,
+        debug_mode=False, stats_mode=True)
+
+    cache.write(0) # Buffered, so not counted yet.
+    self.assertEqual((cache.hits, cache.misses), (0, 0))
+    cache.read(0)  # Served from the write buffer: a hit.
+    cache.read(64) # Read miss.
+    self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    # The buffered write is counted (as a write miss) when it is drained.
+    cache.notify_finished()
+    self.assertEqual((cache.hits, cache.misses), (1, 2))
+    self.assertEqual(cache.hit_ratio(), 1.0 / 3)
+
+  def test_clear(self):
+    """Tests that clearing a cache returns it to its initial state."""
+
+    self.default_cache.read(10)
+    self.default_cache.write(20)
+    self.default_cache.write(20)
+
+    self.default_cache.clear()
+
+    for slot_id in (2, 5):
+      line = self.default_cache.get_cache_line(slot_id)
+      self.assertEqual(line.state, SlotState.INVALID)
+      self.assertEqual(line.previous_state, None)
+      self.assertEqual(line.tag, None)
+      self.assertFalse(line.written_to)
+    self.assertEqual(self.default_cache.latency, 0)
+
+    # A TSO cache also empties its write buffer.
+    cache = TSOCache(1, 16, 8, self.fake_bus, self.fake_tracker, 4, 4, False)
+    cache.write(5)
+    cache.write(6)
+
+    cache.clear()
+
+    self.assertEqual(list(cache.write_buffer), [])
+    self.assertEqual(cache.write_finishes_at, None)
+    self.assertFalse(cache.read(5)) # No longer snooped from the buffer.
+
+  def test_bus_line_size_mismatch(self):
+    """Tests that caches with different line sizes cannot share a bus."""
+
+    bus = Bus()
+    Cache(0, 16, 4, bus, self.fake_tracker, False)
+    with self.assertRaises(ValueError):
+      Cache(1, 16, 8, bus, self.fake_tracker, False)
+
+    bus = Bus()
+    caches = [Cache(0, 16, 4, Bus(), self.fake_tracker, False),
+        Cache(1, 16, 8, Bus(), self.fake_tracker, False)]
+    with self.assertRaises(ValueError):
+      bus.add_caches(caches)
+
+  def test_bus_miss_without_cache(self):
+    """Tests that a miss from a cache which is not on the bus is rejected."""
+
+    bus = Bus()
+    with self.assertRaises(ValueError):
+      bus.read_miss(0, 10)
+    with self.assertRaises(ValueError):
+      bus.write_miss(0, 10)
+
+    Cache(0, 16, 4, bus, self.fake_tracker, False)
+    with self.assertRaises(ValueError):
+      bus.read_miss(1, 10)
+    with self.assertRaises(ValueError):
+      bus.write_miss(1, 10)
+
   def test_sc_read_latency(self):
     """Tests the measurements of read-latency in an SC cache."""
 
@@ -432,18 +515,12 @@ class CachingTest(unittest.TestCase):
 
     # Test line returned by main memory.
 
-    # Duck-punch the fake bus to claim that it read from memory.
-    # (Don't you love Python? Such abuse! :D)
-    old_read_miss = FakeBus.read_miss
-    def new_read_miss(self, cache_id, address):
-        return True
-    FakeBus.read_miss = new_read_miss 
+    # Have the fake bus claim that it read from memory.
+    self.fake_bus.force_memory_miss = True
 
     cache.read(18)
     self.assertEqual(cache.latency, 222)
 
-    FakeBus.read_miss = old_read_miss
-
   def test_tso_read_latency(self):
     """Tests the measurements of read-latency in a TSO cache."""
 
@@ -473,19 +550,12 @@ class CachingTest(unittest.TestCase):
 
     # Test value returned by main memory.
 
-    # Duck-punch the fake bus to claim that it read from memory.
-    # (Don't you love Python? Such abuse! :D)
-    old_read_miss = FakeBus.read_miss
-    def new_read_miss(self, cache_id, address):
-        return True
-    FakeBus.read_miss = new_read_miss 
+    # Have the fake bus claim that it read from memory.
+    self.fake_bus.force_memory_miss = True
 
     cache.read(26)
     self.assertEqual(cache.latency, 223)
 
-    # Restore the FakeBus class.
-    FakeBus.read_miss = old_read_miss
-
   def test_sc_write_latency(self):
     """Tests the measurements of write-latency in an SC cache.
 
@@ -510,19 +580,12 @@ class CachingTest(unittest.TestCase):
 
     # Test value returned by main memory.
 
-    # Duck-punch the fake bus to claim that it read from memory.
-    # (Don't you love Python? Such abuse! :D)
-    old_read_miss = FakeBus.read_miss
-    def new_read_miss(self, cache_id, address):
-        return True
-    FakeBus.read_miss = new_read_miss 
+    # Have the fake bus claim that it read from memory.
+    self.fake_bus.force_memory_miss = True
 
     cache.write(20)
     self.assertEqual(cache.latency, 222)
 
-    # Restore the FakeBus class.
-    FakeBus.read_miss = old_read_miss
-
   def test_tso_write_latency(self):
     """Tests the measurements of write-latency in a TSO cache.
 
@@ -560,50 +623,50 @@ class CachingTest(unittest.TestCase):
 
     # First, check that the method does nothing if a write is still processing.
     cache.write_finishes_at = 15 # Fake a write in progress.
-    cache.write_buffer = [10, 5, 20] # Fake some writes.
+    self._set_write_buffer(cache, [10, 5, 20]) # Fake some writes.
     cache._check_write_buffer()
     self.assertEqual(cache.write_finishes_at, 15)
     self.assertEqual(cache.latency, 0)
-    self.assertEqual(cache.write_buffer, [10, 5, 20])
+    self.assertEqual(list(cache.write_buffer), [10, 5, 20])
 
     # Check that if a write is not in process but there are less than N (here,
     # 2) writes in the buffer, it still does nothing.
     cache.write_finishes_at = None
-    cache.write_buffer = [10]
+    self._set_write_buffer(cache, [10])
     cache._check_write_buffer()
     self.assertEqual(cache.write_finishes_at, None)
     self.assertEqual(cache.latency, 0)
-    self.assertEqual(cache.write_buffer, [10])
+    self.assertEqual(list(cache.write_buffer), [10])
 
     # Check that if a write is finished and there are less than N (here, 2)
     # writes in the buffer, the write is cleared but thats it.
     cache.write_finishes_at = 10
     cache.latency = 15
-    cache.write_buffer = [10]
+    self._set_write_buffer(cache, [10])
     cache._check_write_buffer()
     self.assertEqual(cache.write_finishes_at, None)
     self.assertEqual(cache.latency, 15)
-    self.assertEqual(cache.write_buffer, [10])
+    self.assertEqual(list(cache.write_buffer), [10])
 
     # Check that if a write is finished and there are N writes in the buffer,
     # another write is retired, from the correct end of the line.
     cache.write_finishes_at = 10
     cache.latency = 15
-    cache.write_buffer = [10, 5]
+    self._set_write_buffer(cache, [10, 5])
     cache._check_write_buffer()
     self.assertEqual(cache.write_finishes_at, 237)
     self.assertEqual(cache.latency, 15)
-    self.assertEqual(cache.write_buffer, [5])
+    self.assertEqual(list(cache.write_buffer), [5])
 
     # Check that if a write is not in progress and there are N writes in the
     # buffer, another write is retired, from the correct end of the line.
     cache.write_finishes_at = None
     cache.latency = 25
-    cache.write_buffer = [5, 10]
+    self._set_write_buffer(cache, [5, 10])
     cache._check_write_buffer()
     self.assertEqual(cache.write_finishes_at, 247)
     self.assertEqual(cache.latency, 25)
-    self.assertEqual(cache.write_buffer, [10])
+    self.assertEqual(list(cache.write_buffer), [10])
 
   def test_tso_drain_buffer(self):
     """Tests that the drain buffer logic in the TSO cache is correct."""
@@ -612,31 +675,31 @@ class CachingTest(unittest.TestCase):
     cache = TSOCache(1, 16, 8, self.fake_bus, self.fake_tracker, 4, 2, False)
 
     # Check that draining a cache always clears it completely.
-    cache.write_buffer = [1]
+    self._set_write_buffer(cache, [1])
     cache._drain_write_buffer()
-    self.assertEqual(cache.write_buffer, [])
+    self.assertEqual(list(cache.write_buffer), [])
 
-    cache.write_buffer = [1, 2]
+    self._set_write_buffer(cache, [1, 2])
     cache._drain_write_buffer()
-    self.assertEqual(cache.write_buffer, [])
+    self.assertEqual(list(cache.write_buffer), [])
 
-    cache.write_buffer = [3, 4, 5, 6, 7]
+    self._set_write_buffer(cache, [3, 4, 5, 6, 7])
     cache._drain_write_buffer()
-    self.assertEqual(cache.write_buffer, [])
+    self.assertEqual(list(cache.write_buffer), [])
 
-    cache.write_buffer = []
+    self._set_write_buffer(cache, [])
     cache._drain_write_buffer()
-    self.assertEqual(cache.write_buffer, [])
+    self.assertEqual(list(cache.write_buffer), [])
 
     # Check that when the buffer is drained, any ongoing writes are counted as latency.
-    cache.write_buffer = []
+    self._set_write_buffer(cache, [])
     cache.latency = 20
     cache.write_finishes_at = 126
     cache._drain_write_buffer()
     self.assertEqual(cache.latency, 126)
     self.assertEqual(cache.write_finishes_at, None)
 
-    cache.write_buffer = [10, 20]
+    self._set_write_buffer(cache, [10, 20])
     cache.latency = 20
     cache.write_finishes_at = 126
     cache._drain_write_buffer()
@@ -644,7 +707,7 @@ class CachingTest(unittest.TestCase):
     self.assertEqual(cache.write_finishes_at, None)
 
     # Check that when the buffer is drained, all writes are counted.
-    cache.write_buffer = [10, 20, 30, 40]
+    self._set_write_buffer(cache, [10, 20, 30, 40])
     cache.latency = 0
     cache.write_finishes_at = None
     cache._drain_write_buffer()
@@ -652,7 +715,7 @@ class CachingTest(unittest.TestCase):
     self.assertEqual(cache.write_finishes_at, None)
 
     # Check that when drained, writes execute in the correct order.
-    cache.write_buffer = [10, 138] # Same slot (1), different tag (0 and 1).
+    self._set_write_buffer(cache, [10, 138]) # Same slot (1), different tag (0 and 1).
     cache.latency = 0
     cache.write_finishes_at = None
     cache._drain_write_buffer()
@@ -670,16 +733,16 @@ class CachingTest(unittest.TestCase):
     cache.latency = 500
     cache.notify_finished()
     self.assertEqual(cache.latency, 500)
-    self.assertEqual(cache.write_buffer, [])
+    self.assertEqual(list(cache.write_buffer), [])
     self.assertEqual(cache.write_finishes_at, None)
 
     # Test that the write buffer is properly cleared if there is something in it.
     cache.latency = 500
-    cache.write_buffer = [10, 20]
+    self._set_write_buffer(cache, [10, 20])
     cache.write_finishes_at = 505
     cache.notify_finished()
     self.assertEqual(cache.latency, 505 + (2 * 222))
-    self.assertEqual(cache.write_buffer, [])
+    self.assertEqual(list(cache.write_buffer), [])
     self.assertEqual(cache.write_finishes_at, None)
 
   def test_sc_read_latency_from_trace(self):
@@ -688,11 +751,12 @@ class CachingTest(unittest.TestCase):
     Basically worse than the unittests, but apparently we must provide test
     traces..."""
 
-    with capture_output():
-      self.sc_simulation.simulate("test_traces/sc_read_trace.out")
+    simulation = self._sc_simulation()
+    with silence_output():
+      simulation.simulate("test_traces/sc_read_trace.out")
 
     # Get the statistics.
-    stats = self.sc_simulation.tracker.get_general_stats()
+    stats = simulation.tracker.get_general_stats()
 
     self.assertEqual(stats["max_latency"], 246)
     self.assertEqual(stats["max_latency_cache"], 0)
@@ -703,11 +767,12 @@ class CachingTest(unittest.TestCase):
     Basically worse than the unittests, but apparently we must provide test
     traces..."""
 
-    with capture_output():
-      self.sc_simulation.simulate("test_traces/sc_write_trace.out")
+    simulation = self._sc_simulation()
+    with silence_output():
+      simulation.simulate("test_traces/sc_write_trace.out")
 
     # Get the statistics.
-    stats = self.sc_simulation.tracker.get_general_stats()
+    stats = simulation.tracker.get_general_stats()
 
     self.assertEqual(stats["max_latency"], 666)
     self.assertEqual(stats["max_latency_cache"], 0)
@@ -718,11 +783,12 @@ class CachingTest(unittest.TestCase):
     Basically worse than the unittests, but apparently we must provide test
     traces..."""
 
-    with capture_output():
-      self.tso_simulation.simulate("test_traces/tso_read_trace.out")
+    simulation = self._tso_simulation()
+    with silence_output():
+      simulation.simulate("test_traces/tso_read_trace.out")
 
     # Get the statistics.
-    stats = self.tso_simulation.tracker.get_general_stats()
+    stats = simulation.tracker.get_general_stats()
 
     self.assertEqual(stats["max_latency"], 693)
     self.assertEqual(stats["max_latency_cache"], 0)
@@ -733,14 +799,66 @@ class CachingTest(unittest.TestCase):
     Basically worse than the unittests, but apparently we must provide test
     traces..."""
 
-    with capture_output():
-      self.tso_simulation.simulate("test_traces/tso_write_trace.out")
+    simulation = self._tso_simulation()
+    with silence_output():
+      simulation.simulate("test_traces/tso_write_trace.out")
 
     # Get the statistics.
-    stats = self.tso_simulation.tracker.get_general_stats()
+    stats = simulation.tracker.get_general_stats()
 
     self.assertEqual(stats["max_latency"], 889)
     self.assertEqual(stats["max_latency_cache"], 0)
 
+  def test_debug_check_interval(self):
+    """Tests that consistency is only checked every debug_check_interval
+    accesses, and once more at the end."""
+
+    simulation = self._sc_simulation(debug_check_interval=2)
+    calls = self._record_consistency_tests(simulation)
+    with silence_output():
+      simulation.simulate("test_traces/sc_write_trace.out")
+
+    # The trace has 4 accesses, so it is checked after accesses 2 and 4, and
+    # then at the end.
+    self.assertEqual([consistent for (consistent, _) in calls],
+        [True, True, True])
+
+    # Checking less often does not change the simulation.
+    stats = simulation.tracker.get_general_stats()
+    self.assertEqual(stats["max_latency"], 666)
+
+  def test_final_consistency_check(self):
+    """Tests that consistency is checked once the write buffers have drained
+    at the end of the simulation, even if no check is due."""
+
+    simulation = self._tso_simulation(debug_check_interval=100)
+    calls = self._record_consistency_tests(simulation)
+    with silence_output():
+      simulation.simulate("test_traces/tso_write_trace.out")
+
+    # The trace leaves two writes in P0's write buffer, so they are only empty
+    # if the check runs after the caches are told the program has finished.
+    self.assertEqual(calls, [(True, [0, 0, 0, 0])])
+
+    # An inconsistency is reported by the final check. Slot 7 is never touched
+    # by the trace.
+    simulation = self._sc_simulation(debug_check_interval=100)
+    calls = self._record_consistency_tests(simulation)
+    for cache in simulation.caches[1:3]:
+      cache.get_cache_line(7).tag = 0
+      cache.get_cache_line(7).state = SlotState.MODIFIED
+    with silence_output():
+      simulation.simulate("test_traces/sc_write_trace.out")
+
+    self.assertEqual([consistent for (consistent, _) in calls], [False])
+
+  def test_invalid_debug_check_interval(self):
+    """Tests that a debug_check_interval below 1 is rejected."""
+
+    for interval in (0, -1):
+      with self.subTest(interval=interval):
+        with self.assertRaises(ValueError):
+          self._sc_simulation(debug_check_interval=interval)
+
 if __name__ == "__main__":
   unittest.main()
\ No newline at end of file
@@ -1,34 +1,26 @@
-import math
 import matplotlib.pyplot as plt
 import numpy as np
 import sys
 
 
-def divide_scalar_by(seq, scalar):
-  float_scalar = float(scalar)
-
-  return map(lambda element : float_scalar / element, seq)
-
-
 def main():
   if len(sys.argv) != 2:
-    print "Usage: %s data_file" % sys.argv[0]
+    print("Usage: %s data_file" % sys.argv[0])
     return
 
   # 5 stats in the line info graph. 
   N = 5
 
-  with open(sys.argv[1], "r") as f:
-    lines = [line.strip() for line in f]
-    if len(lines) != 1:
-      raise ValueError("Expected 1 line, found %s." % len(data))
-    values = map(float, lines[0].split())
-    if len(values) != (N + 1):
-      raise ValueError("Unexpected number of parts in line '%s'" % lines[0])
+  # The data file holds a single line: the SC latency, then the N TSO ones.
+  values = np.loadtxt(sys.argv[1], ndmin=1)
+  if values.ndim != 1:
+    raise ValueError("Expected 1 line, found %s." % values.shape[0])
+  if values.size != (N + 1):
+    raise ValueError("Expected %s values, found %s." % (N + 1, values.size))
 
   # The values should be taken relative to the SC.
   sequential_consistency_value = values[0]
-  values = divide_scalar_by(values, sequential_consistency_value)
+  values = sequential_consistency_value / values
 
   # Strip off the SC.
   values = values[1:]
@@ -42,8 +34,7 @@ def main():
 
   ax.set_title("Effect of altering write buffer size")
   ax.set_ylabel('Speedup over Sequential Consistency')
-  y_ticks = range(0, 40)
-  y_ticks = map(lambda x : x / 20.0, y_ticks)
+  y_ticks = np.arange(40) / 20.0
   ax.set_yticks(y_ticks)
   ax.set_xticks(indices)
   ax.set_xticklabels(('TSO [4, 1]',
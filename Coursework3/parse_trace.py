@@ -3,6 +3,7 @@
 
 import caching
 import buses
+import collections
 import itertools
 import optparse
 import statistics
@@ -19,18 +20,35 @@ class SimulationEnvironment:
 
   # The set of inconsistent cache line states for a given memory block across
   # two caches.
-  INCONSISTENT_STATES = [
-    (caching.SlotState.MODIFIED, caching.SlotState.MODIFIED),
-    (caching.SlotState.MODIFIED, caching.SlotState.SHARED),
-    (caching.SlotState.SHARED, caching.SlotState.MODIFIED)
-  ]
+  INCONSISTENT_STATES = frozenset([
+    (caching.MODIFIED, caching.MODIFIED),
+    (caching.MODIFIED, caching.SHARED),
+    (caching.SHARED, caching.MODIFIED)
+  ])
+
+  # INCONSISTENT_STATES as a bitmask, so that a pair of states can be tested
+  # without building a tuple. Bit ((state1 << 2) | state2) is set for each
+  # inconsistent pair.
+  _INCONSISTENT_MASK = sum(1 << ((state1 << 2) | state2)
+      for (state1, state2) in INCONSISTENT_STATES)
+
+  # The buffer size used when reading trace files. Traces can be millions of
+  # lines long, so read them in large blocks.
+  READ_BUFFER_SIZE = 1 << 22
 
   def __init__(self, number_processors, number_lines, line_size,
       consistency_model, write_buffer_size=None, retire_at_count=None,
-      debug_mode=False):
-    """Initializes the simulation, setting up the bus and caches."""
+      debug_mode=False, debug_check_interval=1):
+    """Initializes the simulation, setting up the bus and caches.
+
+    In debug mode, the caches are checked for consistency every
+    debug_check_interval accesses, and at the end of the simulation."""
+
+    if debug_check_interval < 1:
+      raise ValueError("Debug check interval must be positive!")
 
     self.debug_mode = debug_mode
+    self.debug_check_interval = debug_check_interval
 
     self.tracker = statistics.SimulationStatisticsTracker()
     bus = buses.Bus()
@@ -43,7 +61,7 @@ class SimulationEnvironment:
 
     # Set up the caches. Each cache will register itself with the bus.
     self.caches = []
-    for cache_id in xrange(number_processors):
+    for cache_id in range(number_processors):
       cache = self._create_cache(cache_id, number_lines, line_size, bus,
           self.tracker, consistency_model, write_buffer_size, retire_at_count,
           debug_mode)
@@ -55,46 +73,84 @@ class SimulationEnvironment:
     The trace is retrieved from the file named in the trace_filename
     argument."""
 
-    with open(trace_filename, "r") as trace_file:
+    # Look up each cache's read and write methods once, rather than on every
+    # access.
+    readers = [cache.read for cache in self.caches]
+    writers = [cache.write for cache in self.caches]
+    debug_mode = self.debug_mode
+    debug_check_interval = self.debug_check_interval
+
+    # The number of accesses simulated, used to decide when to check for
+    # consistency in debug mode.
+    number_accesses = 0
+
+    # Dispatch table from an access type and a processor name, as written in
+    # the trace ("P0", "P1", ...), to the method simulating that access, so
+    # that neither the access type nor the processor id has to be parsed.
+    accessors = {
+      "R": dict(("P%d" % cache_id, reader)
+          for (cache_id, reader) in enumerate(readers)),
+      "W": dict(("P%d" % cache_id, writer)
+          for (cache_id, writer) in enumerate(writers)),
+    }
+
+    buffer_size = SimulationEnvironment.READ_BUFFER_SIZE
+    with open(trace_filename, "r", buffer_size) as trace_file:
       for line in trace_file:
         # Get rid of any comments.
-        line = line.split("#")[0].strip()
-        if len(line) == 0:
-          # Comment line, skip.
-          continue
+        if "#" in line:
+          line = line.split("#")[0]
 
         parts = line.split()
+        if len(parts) == 0:
+          # Comment line, skip.
+          continue
 
-        cache_id = int(parts[0][1:])
         access_type = parts[1]
-        address = int(parts[2])
-
-        if access_type == "R":
-          self.caches[cache_id].read(address)
-        elif access_type == "W":
-          self.caches[cache_id].write(address)
-        else:
-          print "ERROR: Unknown access type '%s'" % access_type
+        try:
+          by_processor = accessors[access_type]
+        except KeyError:
+          print("ERROR: Unknown access type '%s'" % access_type)
           return
 
+        access = by_processor.get(parts[0])
+        if access is None:
+          # The processor is not named exactly as in the table (e.g. "P01"), so
+          # parse its id instead.
+          cache_id = int(parts[0][1:])
+          if access_type == "R":
+            access = readers[cache_id]
+          else:
+            access = writers[cache_id]
+
+        access(int(parts[2]))
+
         # Sanity check. Early exit means we dont call the expensive
-        # _test_consistency unless in debug mode.
-        if self.debug_mode and not self._test_consistency():
-          print "ERROR: Caches inconsistent."
-          return
+        # _test_consistency unless in debug mode, and then only every
+        # debug_check_interval accesses.
+        if debug_mode:
+          number_accesses += 1
+          if (number_accesses % debug_check_interval == 0 and
+              not self._test_consistency()):
+            print("ERROR: Caches inconsistent.")
+            return
 
     # Notify the caches that the program is finished: used for draining.
     for cache in self.caches:
       cache.notify_finished()
 
+    # Make sure the simulation ends up consistent, whatever the check interval.
+    if debug_mode and not self._test_consistency():
+      print("ERROR: Caches inconsistent.")
+
   def report_stats(self):
     """Prints out statistics on the simulation."""
 
     # The header.
-    print "-" * 21
-    print "Simulation Statistics"
-    print "-" * 21
-    print
+    print("-" * 21)
+    print("Simulation Statistics")
+    print("-" * 21)
+    print()
 
     # Print the latency statistics.
     stats = self.tracker.get_general_stats()
@@ -110,8 +166,8 @@ class SimulationEnvironment:
 
     write_buffer_snoops = stats["write_buffer_snoops"]
 
-    print "Latency Statistics"
-    print
+    print("Latency Statistics")
+    print()
 
     print("\tProgram latency: {0} cycles (cache {1})".format(max_latency,
         max_latency_cache))
@@ -175,32 +231,37 @@ class SimulationEnvironment:
 
     This is VERY EXPENSIVE to compute!"""
 
-    consistent = True
-    for (cache1, cache2) in itertools.combinations(self.caches, 2):
-      # Obtain the known slot ids. As the caches are backed by a dictionary,
-      # not all slots may exist yet (or ever.)
-      cache1_keyset = set(cache1.cache_lines)
-      cache2_keyset = set(cache2.cache_lines)
-
-      # Any slot that is in both dictionaries may contain the same memory block.
-      for common_slot_id in cache1_keyset.intersection(cache2_keyset):
-        cache1_slot = cache1.cache_lines[common_slot_id]
-        cache2_slot = cache2.cache_lines[common_slot_id]
-
-        if cache1_slot.tag != cache2_slot.tag:
-          # The slots hold different memory blocks, so fine.
-          continue
-
-        states = (cache1_slot.state, cache2_slot.state)
-        if states in SimulationEnvironment.INCONSISTENT_STATES:
-          print("Iconsistent states found for slot %s, tag %s."
-              "Cache %s: %s. Cache %s: %s." %
-              (common_slot_id, cache1_slot.tag,
-              cache1.cache_id, cache1_slot.state,
-              cache2.cache_id, cache2_slot.state))
-          consistent = False
-
-    return consistent
+    # Index the valid copies of each memory block, identifying a block by its
+    # (slot id, tag) pair. An INVALID copy can never be inconsistent, so only
+    # valid copies are indexed.
+    copies = collections.defaultdict(list)
+    for (cache_index, cache) in enumerate(self.caches):
+      for (slot_id, (tag, state)) in enumerate(zip(cache.tags, cache.states)):
+        if state != caching.INVALID:
+          copies[(slot_id, tag)].append((cache_index, state))
+
+    # Only blocks held by more than one cache can be inconsistent, and most
+    # blocks are held by just one.
+    inconsistent_mask = SimulationEnvironment._INCONSISTENT_MASK
+    inconsistencies = []
+    for ((slot_id, tag), block_copies) in copies.items():
+      if len(block_copies) < 2:
+        continue
+
+      for ((index1, state1), (index2, state2)) in itertools.combinations(
+          block_copies, 2):
+        if (inconsistent_mask >> ((state1 << 2) | state2)) & 1:
+          inconsistencies.append((index1, index2, slot_id, tag, state1, state2))
+
+    # Report in order of cache pair, then slot id.
+    for (index1, index2, slot_id, tag, state1, state2) in sorted(
+        inconsistencies):
+      print("Iconsistent states found for slot %s, tag %s."
+          "Cache %s: %s. Cache %s: %s." %
+          (slot_id, tag, self.caches[index1].cache_id, state1,
+          self.caches[index2].cache_id, state2))
+
+    return not inconsistencies
 
 
 def main():
@@ -256,6 +317,15 @@ def main():
     default=False,
     dest="debug_mode",
     help="Turn debug mode on. [default: %default]")
+  parser.add_option(
+    "-c",
+    "--debug_check_interval",
+    action="store",
+    default=1,
+    dest="debug_check_interval",
+    help=("In debug mode, how many accesses to simulate between consistency "
+        "checks. [default: %default]"),
+    type="int")
 
   (options, args) = parser.parse_args()
 
@@ -266,7 +336,7 @@ def main():
 
   consistency_model = args[0].upper()
   if consistency_model not in ["SC", "TSO"]:
-    print "ERROR: Unknown consistency model '%s'" % consistency_model
+    print("ERROR: Unknown consistency model '%s'" % consistency_model)
     return
 
   # Warn the user if they've set -w/-r but used SC.
@@ -279,7 +349,7 @@ def main():
 
   trace_filename = args[1]
   if options.debug_mode:
-    print "File: %s" % trace_filename
+    print("File: %s" % trace_filename)
 
   simulation = SimulationEnvironment(
       options.number_processors,
@@ -287,6 +357,7 @@ def main():
       options.line_size,
       consistency_model,
       debug_mode=options.debug_mode,
+      debug_check_interval=options.debug_check_interval,
       write_buffer_size=write_buffer_size,
       retire_at_count=retire_at_count)
   simulation.simulate(trace_filename)
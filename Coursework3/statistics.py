@@ -1,5 +1,7 @@
-from caching import SlotState
+from caching import INVALID, MODIFIED
+import array
 import collections
+import operator
 
 
 class CacheStatistics:
@@ -43,9 +45,10 @@ class CacheStatistics:
     self.total_writes_drained = 0
     self.write_buffer_snoops = 0
 
-    # Used to track the latency between writes.
+    # Used to track the latency between writes. The latencies are kept in a
+    # typed array of 64-bit integers, as a long trace records one per write.
     self.last_write_latency = 0
-    self.latencies_between_writes = []
+    self.latencies_between_writes = array.array('q')
 
   @property
   def accessed_lines(self):
@@ -82,9 +85,24 @@ class SimulationStatisticsTracker:
   def __init__(self):
     self.caches = {}
 
+    # The number of caches that have accessed each address, updated as each
+    # cache first accesses an address.
+    self._address_processor_counts = collections.defaultdict(int)
+
+    # Map from each cache_id to a tuple of the other registered caches, which
+    # are checked for the accessed line on every access.
+    self._other_caches = {}
+
   def add_cache(self, cache):
     """Register a cache with the tracker."""
 
+    for (cache_id, others) in list(self._other_caches.items()):
+      if cache_id != cache.cache_id:
+        self._other_caches[cache_id] = others + (cache,)
+    self._other_caches[cache.cache_id] = tuple(cache_stats.cache
+        for cache_stats in self.caches.values()
+        if cache_stats.cache.cache_id != cache.cache_id)
+
     self.caches[cache.cache_id] = CacheStatistics(cache)
 
   def drain_write_buffer(self, cache_id, writes_drained):
@@ -116,7 +134,8 @@ class SimulationStatisticsTracker:
     line = (tag, slot_id)
 
     cache_stats.read_hits += 1
-    self._handle_read(cache_stats, address, line)
+    cache_stats.read_lines.add(line)
+    self._handle_access(cache_stats, address, line)
 
   def read_miss(self, cache_id, address, tag, slot_id, coherence_miss):
     """Notify the tracker of a read miss for a particular cache."""
@@ -127,7 +146,8 @@ class SimulationStatisticsTracker:
     cache_stats.read_misses += 1
     if coherence_miss:
       cache_stats.coherence_misses += 1
-    self._handle_read(cache_stats, address, line)
+    cache_stats.read_lines.add(line)
+    self._handle_access(cache_stats, address, line)
 
   def write_hit(self, cache_id, address, tag, slot_id):
     """Notify the tracker of a write hit for a particular cache."""
@@ -136,7 +156,8 @@ class SimulationStatisticsTracker:
     line = (tag, slot_id)
 
     cache_stats.write_hits += 1
-    self._handle_write(cache_stats, address, line)
+    cache_stats.written_lines.add(line)
+    self._handle_access(cache_stats, address, line)
 
   def write_miss(self, cache_id, address, tag, slot_id, coherence_miss):
     """Notify the tracker of a write miss for a particular cache."""
@@ -147,7 +168,8 @@ class SimulationStatisticsTracker:
     cache_stats.write_misses += 1
     if coherence_miss:
       cache_stats.coherence_misses += 1
-    self._handle_write(cache_stats, address, line)
+    cache_stats.written_lines.add(line)
+    self._handle_access(cache_stats, address, line)
 
   def get_cache_stats(self, cache_id):
     """Return a dictionary with statistics for a given cache."""
@@ -156,11 +178,7 @@ class SimulationStatisticsTracker:
 
     # If necessary, compute the cache statistics.
     if cache_stats.static_private_accesses is None:
-      self._compute_static_private_accesses(cache_id)
-    if cache_stats.static_public_read_only_accesses is None:
-      self._compute_static_public_read_only_accesses(cache_id)
-    if cache_stats.static_public_read_write_accesses is None:
-      self._compute_static_public_read_write_accesses(cache_id)
+      self._compute_static_accesses()
 
     # Fill up the dictionary.
     stats = {}
@@ -191,63 +209,48 @@ class SimulationStatisticsTracker:
     """Return a dictionary with statistics for the whole simulation."""
 
     # Check that each cache has had it's statistics calculated.
-    for (cache_id, cache_stats) in self.caches.items():
-      if cache_stats.static_private_accesses is None:
-        self._compute_static_private_accesses(cache_id)
-      if cache_stats.static_public_read_only_accesses is None:
-        self._compute_static_public_read_only_accesses(cache_id)
-      if cache_stats.static_public_read_write_accesses is None:
-        self._compute_static_public_read_write_accesses(cache_id)
-
-    # Compute the average private access count, public read-only count, and
-    # public read-write count.
-
-    caches_stats = self.caches.values()
-    
-    accesses = sum([cs.accesses for cs in caches_stats])
-    dynamic_private_accesses = sum([cs.dynamic_private_accesses for cs in caches_stats])
-    dynamic_public_read_only_accesses = sum(
-      [cs.dynamic_public_read_only_accesses for cs in caches_stats])
-    dynamic_public_read_write_accesses = sum(
-      [cs.dynamic_public_read_write_accesses for cs in caches_stats])
-    
-    accesses = sum([cs.accesses for cs in caches_stats])
-    static_private_accesses = sum([cs.static_private_accesses for cs in caches_stats])
-    static_public_read_only_accesses = sum(
-      [cs.static_public_read_only_accesses for cs in caches_stats])
-    static_public_read_write_accesses = sum(
-      [cs.static_public_read_write_accesses for cs in caches_stats])
-
-    # Compute the addresses accessed by 1, 2, and >2 processes.
-    all_accessed_addresses = set()
-    for cache_stats in self.caches.values():
-      all_accessed_addresses = all_accessed_addresses.union(
-          cache_stats.accessed_addresses)
-    number_addresses = float(len(all_accessed_addresses))
-
-    # Count how many processors accessed each address.
-    address_counts = collections.defaultdict(int)
-    for address in all_accessed_addresses:
-      for cache_stats in self.caches.values():
-        if address in cache_stats.accessed_addresses:
-          address_counts[address] += 1
-
-    # Then filter to get each set.
-    one_proc_addresses = filter(lambda x : address_counts[x] == 1,
-        all_accessed_addresses)
-    two_proc_addresses = filter(lambda x : address_counts[x] == 2,
-        all_accessed_addresses)
-    more_than_two_proc_addresses = filter(lambda x : address_counts[x] > 2,
-        all_accessed_addresses)
-
-    addressed_by_one_processor = len(one_proc_addresses)
-    addressed_by_two_processors = len(two_proc_addresses)
-    addressed_by_more_than_two_processors = len(more_than_two_proc_addresses)
-
-    # Calculate the program latency.
-    latencies = [cs.cache.latency for cs in caches_stats]
-    max_latency = max(latencies)
-    max_latency_cache = latencies.index(max_latency)
+    if any(cache_stats.static_private_accesses is None
+        for cache_stats in self.caches.values()):
+      self._compute_static_accesses()
+
+    # Compute the total private access count, public read-only count, and
+    # public read-write count, along with the total accesses, in one pass over
+    # the caches.
+    caches_stats = list(self.caches.values())
+
+    accesses = 0
+    dynamic_private_accesses = 0
+    dynamic_public_read_only_accesses = 0
+    dynamic_public_read_write_accesses = 0
+    static_private_accesses = 0
+    static_public_read_only_accesses = 0
+    static_public_read_write_accesses = 0
+    for cs in caches_stats:
+      accesses += cs.accesses
+      dynamic_private_accesses += cs.dynamic_private_accesses
+      dynamic_public_read_only_accesses += cs.dynamic_public_read_only_accesses
+      dynamic_public_read_write_accesses += (
+          cs.dynamic_public_read_write_accesses)
+      static_private_accesses += cs.static_private_accesses
+      static_public_read_only_accesses += cs.static_public_read_only_accesses
+      static_public_read_write_accesses += cs.static_public_read_write_accesses
+
+    # Compute the addresses accessed by 1, 2, and >2 processes, from the
+    # number of processors that accessed each address.
+    number_addresses = float(len(self._address_processor_counts))
+    processor_counts = collections.Counter(
+        self._address_processor_counts.values())
+
+    addressed_by_one_processor = processor_counts[1]
+    addressed_by_two_processors = processor_counts[2]
+    addressed_by_more_than_two_processors = (len(self._address_processor_counts)
+        - addressed_by_one_processor - addressed_by_two_processors)
+
+    # Calculate the program latency, in one pass over the caches. As with
+    # list.index, ties go to the first cache with the maximum latency.
+    (max_latency_cache, max_latency) = max(
+        enumerate(cs.cache.latency for cs in caches_stats),
+        key=operator.itemgetter(1))
 
     # Write buffer statistics.
     cache_stats = caches_stats[max_latency_cache]
@@ -298,137 +301,91 @@ class SimulationStatisticsTracker:
 
     return stats
 
-  def _handle_read(self, cache_stats, address, line):
-    """Handles statistics updates regarding a generic read."""
-
-    cache_stats.read_lines.add(line)
-
-    self._handle_access(cache_stats, address, line)
-
-  def _handle_write(self, cache_stats, address, line):
-    """Handles statistics updates regarding a generic write."""
-
-    cache_stats.written_lines.add(line)
-
-    self._handle_access(cache_stats, address, line)
-
   def _handle_access(self, cache_stats, address, line):
-    """Handles statistics updates regarding a generic access."""
+    """Handles statistics updates regarding a generic access.
 
-    cache_stats.accessed_addresses.add(address)
-    cache_stats.access_counts[line] += 1
+    The read and write entry points update their own counters and line sets
+    directly, so that each access makes only this one further call."""
 
-    issuing_cache_id = cache_stats.cache.cache_id
+    if address not in cache_stats.accessed_addresses:
+      cache_stats.accessed_addresses.add(address)
+      self._address_processor_counts[address] += 1
+    cache_stats.access_counts[line] += 1
 
     (tag, slot) = line
 
-    # Track dynamic access statistics.
-    other_slots = []
-    for other_cache_stats in self.caches.values():
-      if other_cache_stats.cache.cache_id == issuing_cache_id:
-        # Don't count self!
-        continue
-
-      other_cache_line = other_cache_stats.cache.get_cache_line(slot)
-      if (other_cache_line.state != SlotState.INVALID and
-          other_cache_line.tag == tag):
-        other_slots.append(other_cache_line)
+    # The tracker is notified before the bus, so the issuing cache's slot still
+    # holds its state from before the access. If that is MODIFIED for this
+    # line, the MSI protocol guarantees no other cache holds a valid copy, so
+    # the access is private without looking at the other caches.
+    cache = cache_stats.cache
+    if cache.states[slot] == MODIFIED and cache.tags[slot] == tag:
+      cache_stats.dynamic_private_accesses += 1
+      return
+
+    # Track dynamic access statistics, against every cache but the issuing one.
+    # A remote copy that has been written to makes the access read-write
+    # regardless of the other caches, so the search can stop there.
+    shared = False
+    for other_cache in self._other_caches[cache.cache_id]:
+      if other_cache.states[slot] != INVALID and other_cache.tags[slot] == tag:
+        if other_cache.written_to[slot]:
+          cache_stats.dynamic_public_read_write_accesses += 1
+          return
+        shared = True
 
     # Determine the type of access: private, read-write, or read-only.
-    if len(other_slots) == 0:
+    if not shared:
       cache_stats.dynamic_private_accesses += 1
+    elif cache.written_to[slot]:
+      cache_stats.dynamic_public_read_write_accesses += 1
     else:
-      # Check whether any cache has written to the slot.
-      remote_written = any(map(lambda x : x.written_to, other_slots))
-      local_written = cache_stats.cache.get_cache_line(slot).written_to
-      if remote_written or local_written:
-        cache_stats.dynamic_public_read_write_accesses += 1
-      else:
-        cache_stats.dynamic_public_read_only_accesses += 1
-
-  def _compute_static_private_accesses(self, cache_id):
-    """Count the accesses to private lines for a cache."""
-
-    cache_stats = self.caches[cache_id]
-
-    # First, determine the lines that are private. These are defined as
-    # all of the lines accessed by the given cache, excepting ones also
-    # accessed by other caches.
-    cache_lines = cache_stats.accessed_lines
-    for (other_cache_id, other_cache_stats) in self.caches.iteritems():
-      if cache_id == other_cache_id:
-        # Dont count self!
-        continue
-
-      cache_lines = cache_lines - other_cache_stats.accessed_lines
-
-    # Count the accesses to private lines.
-    static_private_accesses = 0
-    for line in cache_lines:
-      static_private_accesses += cache_stats.access_counts[line]
-
-    # Update the cache stats.
-    cache_stats.static_private_accesses = static_private_accesses
-
-  def _compute_static_public_read_only_accesses(self, cache_id):
-    """Count the accesses to public, read-only lines for a cache."""
-
-    cache_stats = self.caches[cache_id]
-
-    # To compute shared read-only lines we must first determine what lines
-    # are read-only by *any* other cache.    
-    other_read_only_lines = set()
-    for (other_cache_id, other_cache_stats) in self.caches.iteritems():
-      if cache_id == other_cache_id:
-        continue
-
-      other_read_only_lines = other_read_only_lines.union(
-          other_cache_stats.read_only_lines)
-
-    # Then, intersect this cache's read-only lines with the global set,
-    # to determine which lines this cache accessed.
-    local_read_only_lines = cache_stats.read_only_lines
-    shared_read_only_lines = local_read_only_lines.intersection(
-        other_read_only_lines)
-
-    # Finally, count the accesses to the public read-only lines.
-    static_public_read_only_accesses = 0
-    for line in shared_read_only_lines:
-      static_public_read_only_accesses += cache_stats.access_counts[line]
-
-    # Update the cache stats.
-    cache_stats.static_public_read_only_accesses = static_public_read_only_accesses
-
-  def _compute_static_public_read_write_accesses(self, cache_id):
-    """Count the accesses to public, read-write lines for a cache."""
-
-    # Grab this cache's stats.
-    cache_stats = self.caches[cache_id]
-
-    # To compute shared read-write lines we must first determine what lines
-    # are accessed at all by any other cache. 
-    other_accessed_lines = set()
-    for (other_cache_id, other_cache_stats) in self.caches.iteritems():
-      if cache_id == other_cache_id:
-        continue
-
-      other_accessed_lines = other_accessed_lines.union(
-          other_cache_stats.accessed_lines)
-
-    # Then determine which public lines are also accessed by this cache.
-    shared_lines = cache_stats.accessed_lines.intersection(
-        other_accessed_lines)
-
-    # Count the accesses to public lines.
-    static_public_read_write_accesses = 0
-    for line in shared_lines:
-      static_public_read_write_accesses += cache_stats.access_counts[line]
-
-    # Skip accesses to read-only lines.
-    static_public_read_write_accesses -= cache_stats.static_public_read_only_accesses
+      cache_stats.dynamic_public_read_only_accesses += 1
+
+  def _compute_static_accesses(self):
+    """Count the accesses to private, public read-only, and public read-write
+    lines for every cache.
+
+    A line is private to a cache if no other cache accessed it. It is public
+    read-only for a cache if that cache and at least one other cache only
+    read it. Any other line accessed by more than one cache is public
+    read-write."""
+
+    # Index, for each line, the caches that accessed it and the caches that
+    # only read it. This is built once for all of the caches, rather than
+    # combining every other cache's line sets for each cache.
+    accessing_caches = collections.defaultdict(set)
+    read_only_caches = collections.defaultdict(set)
+    for (cache_id, cache_stats) in self.caches.items():
+      for line in cache_stats.access_counts:
+        accessing_caches[line].add(cache_id)
+      for line in cache_stats.read_only_lines:
+        read_only_caches[line].add(cache_id)
 
-    # Update the cache stats.
-    cache_stats.static_public_read_write_accesses = static_public_read_write_accesses
+    for (cache_id, cache_stats) in self.caches.items():
+      static_private_accesses = 0
+      static_public_read_only_accesses = 0
+      static_public_accesses = 0
+
+      # Every accessed line has an access count, so a single pass over the
+      # counts classifies all of them.
+      for (line, count) in cache_stats.access_counts.items():
+        if len(accessing_caches[line]) == 1:
+          static_private_accesses += count
+          continue
+
+        static_public_accesses += count
+        line_read_only_caches = read_only_caches.get(line, ())
+        if cache_id in line_read_only_caches and len(line_read_only_caches) > 1:
+          static_public_read_only_accesses += count
+
+      # Update the cache stats. Public accesses which are not to read-only
+      # lines are to read-write lines.
+      cache_stats.static_private_accesses = static_private_accesses
+      cache_stats.static_public_read_only_accesses = (
+          static_public_read_only_accesses)
+      cache_stats.static_public_read_write_accesses = (
+          static_public_accesses - static_public_read_only_accesses)
 
 
 def mean(seq):
@@ -438,12 +395,32 @@ def mean(seq):
 
 
 def median(seq):
-  """Calculate the median of a sequence."""
-
-  sorted_seq = sorted(seq)
-  length = len(sorted_seq)
-
-  if len(sorted_seq) % 2 == 0:
-    return (sorted_seq[length / 2] + sorted_seq[(length / 2) - 1]) / 2.0
-
-  return sorted_seq[length / 2]
\ No newline at end of file
+  """Calculate the median of a sequence.
+
+  Rather than sorting the whole sequence, the distinct values are counted and
+  only those are sorted, as sequences such as the latencies between writes hold
+  few distinct values."""
+
+  length = len(seq)
+  if length == 0:
+    raise IndexError("cannot take the median of an empty sequence")
+
+  # Walk the distinct values in order until reaching the middle position(s) of
+  # the sorted sequence; these are the same position if the length is odd.
+  counts = collections.Counter(seq)
+  lower_position = (length - 1) // 2
+  upper_position = length // 2
+  lower = None
+  seen = 0
+  for value in sorted(counts):
+    seen += counts[value]
+    if lower is None and seen > lower_position:
+      lower = value
+    if seen > upper_position:
+      upper = value
+      break
+
+  if length % 2 == 0:
+    return (upper + lower) / 2.0
+
+  return upper